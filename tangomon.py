@@ -18,31 +18,101 @@ __version__ = "2.0"
 
 
 import argparse
+import collections
 import datetime
 import gettext
+import io
 import json
 import math
 import os
 import random
-import shutil
 import sys
+import threading
 import time
+import tracemalloc
 import warnings
 import webbrowser
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
 import sge
 import xsge_gui
 
+import tangomon_core as core
+
+
+startup_times = []
+startup_phase_start = time.perf_counter()
+startup_profiler = None
+startup_tracemalloc = False
+
+
+def mark_startup_phase(phase):
+    """
+    Record how long the startup phase that just ended took and how much
+    memory was in use at its end.  Traced memory is only recorded while
+    tracemalloc is tracing.
+    """
+    global startup_phase_start
+
+    now = time.perf_counter()
+    record = {"phase": phase, "time": now - startup_phase_start}
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS, but in kilobytes elsewhere.
+        if sys.platform != "darwin":
+            max_rss *= 1024
+        record["max_rss"] = max_rss
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        record["memory"] = current
+        record["memory_peak"] = peak
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+    startup_times.append(record)
+    startup_phase_start = time.perf_counter()
+
+
+def write_startup_profile(path, cprofile_path=None):
+    """
+    Write the startup phases recorded so far to ``path`` as JSON, and
+    the cProfile statistics to ``cprofile_path`` if it is given.
+    Profiling is stopped afterwards.
+    """
+    global startup_tracemalloc
+
+    if startup_tracemalloc:
+        tracemalloc.stop()
+        startup_tracemalloc = False
+
+    if startup_profiler is not None:
+        startup_profiler.disable()
+        if cprofile_path:
+            startup_profiler.dump_stats(cprofile_path)
+
+    report = {"version": __version__,
+              "python": sys.version.split()[0],
+              "platform": sys.platform,
+              "total_time": sum(r["time"] for r in startup_times),
+              "phases": startup_times}
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4)
+        f.write("\n")
+
 
 if getattr(sys, "frozen", False):
     __file__ = sys.executable
 
 DATA = os.path.join(os.path.dirname(__file__), "data")
-CONFIG = os.path.join(
-    os.getenv("XDG_CONFIG_HOME", os.path.join(os.path.expanduser("~"),
-                                              ".config")), "tangomon")
+CONFIG = core.CONFIG
+OFFLINE_PATH = "tangomon-offline.txt"
+OFFLINE_ANSWERS_PATH = "tangomon-offline-answers.txt"
 
 gettext.install("tangomon", os.path.abspath(os.path.join(DATA, "locale")))
+mark_startup_phase("gettext")
 
 parser = argparse.ArgumentParser(prog="Tangomon")
 parser.add_argument(
@@ -68,15 +138,76 @@ parser.add_argument(
 parser.add_argument(
     "-o", "--offline", type=int,
     help=_('Offline play for the indicated slot (slot numbers go from 1 to 5, where 1 is the first slot). A list of all tangoji, tangokans, and tests you need to study will be printed to "tangomon-offline.txt". When finished, you can turn in your results with the "--results" option.'))
+parser.add_argument(
+    "--offline-slots", metavar="SLOTS",
+    help=_('Offline play for several slots at once: "all", or slot numbers separated by commas (for example "1,3"). Works like the "--offline" option, but each file is named after its slot (for example "tangomon-offline-slot1.txt"), and results are read with the "--results-file" option from files named the same way.'))
+parser.add_argument(
+    "-j", "--jobs", type=int, default=1,
+    help=_('Use alongside the "--offline-slots" option to process that many slots at once in separate processes (Default: 1).'))
+parser.add_argument(
+    "--offline-summary", metavar="FILE",
+    help=_('Use alongside the "--offline-slots" option to also write a JSON summary of every slot processed to FILE.'))
+parser.add_argument(
+    "--offline-output", metavar="FILE", default=OFFLINE_PATH,
+    help=_('Use alongside the "--offline" option to choose where the list of things to study is written, or "-" to print it (Default: "{}").').format(OFFLINE_PATH))
+parser.add_argument(
+    "--offline-answers", metavar="FILE", default=OFFLINE_ANSWERS_PATH,
+    help=_('Use alongside the "--offline" option to choose where the answer key is written, or "-" to print it (Default: "{}").').format(OFFLINE_ANSWERS_PATH))
 parser.add_argument(
     "-r", "--results",
     help=_("Use alongside the \"--offline\" option to submit your results for offline play."),
     action="store_true")
+parser.add_argument(
+    "--results-file", metavar="FILE",
+    help=_('Use alongside the "--offline" option to submit your results for offline play from a file instead of typing them in, or from standard input if FILE is "-". The file must have a line "time_code N" with the time code of your offline session, and a line "test N" or "tangokan N" for each of your FAILED tests and tangokans.'))
+parser.add_argument(
+    "--export-slot", nargs=2, metavar=("SLOT", "FILE"),
+    help=_("Export the indicated save slot to a JSON file and exit."))
+parser.add_argument(
+    "--import-slot", nargs=2, metavar=("SLOT", "FILE"),
+    help=_("Replace the indicated save slot with the contents of a JSON file and exit."))
+parser.add_argument(
+    "--import-tangojis", nargs=2, metavar=("SLOT", "FILE"),
+    help=_('Add the tangojis listed in a CSV, TSV or Anki text export file to the indicated save slot and exit, or read them from standard input if FILE is "-". Each line must have a tangoji, its clue and optionally extra information. Tangojis the slot already has are skipped.'))
+parser.add_argument(
+    "--profile-startup", metavar="FILE",
+    help=_("Write a JSON report of the time and memory taken by each phase of startup to FILE."))
+parser.add_argument(
+    "--profile-startup-cprofile", metavar="FILE",
+    help=_("Also write cProfile statistics of startup to FILE. Requires the \"--profile-startup\" option."))
+parser.add_argument(
+    "--forecast", nargs=2, type=int, metavar=("SLOT", "MONTHS"),
+    help=_("Print how many tests of the indicated save slot will fall due on each day of the next MONTHS months and exit."))
 args = parser.parse_args()
 
+if args.forecast is not None and args.forecast[1] <= 0:
+    parser.error(_("argument --forecast: MONTHS must be greater than 0"))
+
+if args.profile_startup_cprofile and not args.profile_startup:
+    parser.error(_("argument --profile-startup-cprofile: requires --profile-startup"))
+
+# These options take a slot number along with a file name, so argparse
+# can't convert them by itself.
+for option, value in [("--export-slot", args.export_slot),
+                      ("--import-slot", args.import_slot),
+                      ("--import-tangojis", args.import_tangojis)]:
+    if value is not None:
+        try:
+            value[0] = int(value[0])
+        except ValueError:
+            parser.error(_("argument {option}: invalid slot number: '{slot}'").format(
+                option=option, slot=value[0]))
+
 NOSAVE = args.nosave
 DELTA = not args.nodelta
 OFFLINE_RESULTS = args.results
+OFFLINE_RESULTS_FILE = args.results_file
+EXPORT_SLOT = args.export_slot
+IMPORT_SLOT = args.import_slot
+IMPORT_TANGOJIS = args.import_tangojis
+FORECAST = args.forecast
+PROFILE_STARTUP = args.profile_startup
+PROFILE_STARTUP_CPROFILE = args.profile_startup_cprofile
 if args.datadir:
     DATA = args.datadir
 if args.configdir:
@@ -85,6 +216,25 @@ if args.offline:
     OFFLINE_SLOT = args.offline
 else:
     OFFLINE_SLOT = None
+OFFLINE_SLOTS = args.offline_slots
+OFFLINE_JOBS = args.jobs
+OFFLINE_SUMMARY = args.offline_summary
+OFFLINE_OUTPUT = args.offline_output
+OFFLINE_ANSWERS = args.offline_answers
+
+core.DATA = DATA
+core.NOSAVE = NOSAVE
+core.set_config_dir(CONFIG)
+
+if PROFILE_STARTUP:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        startup_tracemalloc = True
+    if PROFILE_STARTUP_CPROFILE:
+        import cProfile
+        startup_profiler = cProfile.Profile()
+        startup_profiler.enable()
+mark_startup_phase("arguments")
 
 gettext.install("tangomon", os.path.abspath(os.path.join(DATA, "locale")))
 
@@ -93,32 +243,29 @@ if args.lang:
                                os.path.abspath(os.path.join(DATA, "locale")),
                                [args.lang])
     lang.install()
+mark_startup_phase("locale")
 
 SCREEN_SIZE = [960, 540]
 BG_WIDTH = 960
 BG_HEIGHT = 352
-FPS = 60
-DELTA_MIN = FPS / 20
-DELTA_MAX = FPS * 4
+DELTA_MIN = core.FPS / 20
+DELTA_MAX = core.FPS * 4
 
-CONFIG_PATH = os.path.join(CONFIG, "config.json")
-SAVE_SLOTS_PATH = os.path.join(CONFIG, "save_slots.json")
-SAVE_SLOTS_BACKUP_PATH = os.path.join(CONFIG, "save_slots.json~")
 
 KEY_REPEAT_INTERVAL = 20
 KEY_REPEAT_DELAY = 400
 
-SAVE_NSLOTS = 5
-
 TEXT_SPEED = 1000
 TANGOJI_LIST_SIZE = 10
+STATS_FORECAST_DAYS = 30
 
-TANGOJI_MIN = 3
+UNKNOWN_TANGOMON_SIZE = 64
+SPRITE_CACHE_SIZE = 32
+TEXT_CACHE_SIZE = 8
+MUSIC_CACHE_SIZE = 16
+SOUND_EXTENSIONS = {".wav", ".ogg", ".flac"}
+SOUND_VOLUMES = {"engage_tangokan": 0.8}
 
-ZONES = [
-    "grassland", "camp_green", "oceanic_abyss", "dark_forest", "haunted_castle",
-    "oasial_crypt", "mountains_of_malevolence", "death_valley",
-    "doom_dungeon"]
 ZONE_NAMES = {
     "grassland": _("Grassland"),
     "camp_green": _("Camp Green"),
@@ -130,33 +277,9 @@ ZONE_NAMES = {
     "death_valley": _("Death Valley"),
     "doom_dungeon": _("Doom Dungeon")}
 
-HEALTH_MAX_START = 500
-BASE_POWER_START = 75
-HEALTH_INCREMENT_FACTOR = 1.025
-BASE_POWER_INCREMENT_FACTOR = 1.025
-ZONE_BUFFER = 3
-
-BATTLE_START_WAIT = 2 * FPS
-TEST_WAIT = FPS / 2
-TEST_LIMIT = 5
-ATTACK_INTERVAL_TIME = 4 * FPS
-ATTACK_INTERVAL_FAIL_TIME = 8 * FPS
-TANGOJI_ENTRY_TIME = 10 * FPS
-TANGOJI_MULT_START = 1.0
-TANGOJI_MULT_DECREMENT = 0.025
-TANGOJI_MULT_MIN = 0.25
-TANGOJI_MULT_PERSISTENT_MIN = 0.5
-TANGOJI_MULT_BULK_BONUS = 0.005
-TANGOJI_MULT_TIME_BONUS = 0.5 / TANGOJI_ENTRY_TIME
-CRITICAL_CHANCE = 0.02
-CRITICAL_MULT = 2
-ENEMY_NERF = 0.5
-
-MINUTE = 60
-HOUR = 60 * MINUTE
-DAY = 24 * HOUR
-MONTH = 30 * DAY
-TANGOKAN_WAIT_TIME = 12 * HOUR
+OFFLINE_TEMPLATE = _("TANGOMON OFFLINE ({name})\n\nTime code: {time_code}\n\nTests:\n{tangojections}\n\nTangojis:\n{tangojis}\n\nTangokans:\n{tangokans}")
+OFFLINE_ANSWERS_TEMPLATE = _("TANGOMON OFFLINE ANSWERS ({name})\n\nTime code: {time_code}\n\nTests:\n{tangojections}\n\nTangojis:\n{tangojis}\n\nTangokans:\n{tangokans}")
+OFFLINE_INFO_TEMPLATE = _("{tangoji} ({info})")
 
 first_run = True
 
@@ -166,23 +289,23 @@ scale_method = None
 sound_enabled = True
 music_enabled = True
 fps_enabled = False
-save_slots = [None for i in range(SAVE_NSLOTS)]
+sound_warm_up = True
+sprite_cache_size = SPRITE_CACHE_SIZE
 
 font = None
 font_small = None
 font_big = None
-loaded_music = {}
-tangomon_sets = {}
-
-current_save_slot = None
-
-player_name = None
-player_zone = 0
-player_tangojis = []
-player_tangokans = []
-player_tangomon = []
-player_tangojections = []
-tangomon_encountered = {}
+music_manager = None
+sound_bank = None
+arena_sprites = {}
+arena_sprites_lock = threading.Lock()
+preload_thread = None
+preload_condition = threading.Condition()
+pending_preload = None
+preloaded_battle = None
+tangomon_sprite_cache = None
+text_sprite_cache = None
+font_version = 0
 
 
 class Game(sge.dsp.Game):
@@ -201,10 +324,10 @@ class Game(sge.dsp.Game):
                 self.fps_time = 0
                 self.fps_frames = 0
 
-            self.project_text(font_small, self.fps_text, self.width - 8,
-                              self.height - 8, z=1000,
-                              color=sge.gfx.Color("yellow"), halign="right",
-                              valign="bottom")
+            project_cached_text(self, font_small, self.fps_text,
+                                self.width - 8, self.height - 8, 1000,
+                                color=sge.gfx.Color("yellow"), halign="right",
+                                valign="bottom")
 
     def event_mouse_button_press(self, button):
         if button == "middle":
@@ -291,7 +414,7 @@ class Worldmap(Room):
             0, 0, zone_w, zone_h, outline=sge.gfx.Color(sge.s.white))
         self.zone_sprites = []
         d = os.path.join(DATA, "images", "zones")
-        for zone in ZONES:
+        for zone in core.ZONES:
             new_sprite = unknown_zone_sprite
             try:
                 new_sprite = sge.gfx.Sprite(
@@ -306,67 +429,72 @@ class Worldmap(Room):
 
             self.zone_sprites.append(new_sprite)
 
+        request_preload(core.ZONES[core.player_zone])
+
+        self.name_sprites = []
+        self.progress_sprites = []
+        self.progress_version = None
+        self.font_version = None
+
+    def update_progress(self):
+        # The progress shown for each zone only changes along with the
+        # player's team, so it is only counted and drawn again then.
+        # All labels are drawn again if the fonts have changed.
+        if self.font_version != font_version:
+            self.name_sprites = []
+            for zone in core.ZONES:
+                self.name_sprites.append(get_text_sprite(
+                    font, ZONE_NAMES[zone], halign=sge.s.center,
+                    valign=sge.s.bottom))
+            self.progress_version = None
+            self.font_version = font_version
+
+        if self.progress_version == core.roster_version:
+            return
+
+        unique_tangomon = set(core.player_tangomon)
+        self.progress_sprites = []
+        for zone in core.ZONES:
+            caught = len(unique_tangomon & core.tangomon_sets[zone])
+            avail = len(core.tangomon_sets[zone])
+            prog_text = "{}/{} ({}%)".format(
+                caught, avail, int(100 * caught / avail))
+            self.progress_sprites.append(get_text_sprite(
+                font, prog_text, halign=sge.s.center, valign=sge.s.top))
+
+        self.progress_version = core.roster_version
+
     def event_step(self, time_passed, delta_mult):
+        self.update_progress()
+
         zone_distance = self.zone_w + 16
         text_distance = self.zone_h / 2 + 8
-        x = self.width / 2 - player_zone * zone_distance
+        x = self.width / 2 - core.player_zone * zone_distance
         y = self.height / 2
         name_y = y - text_distance
         progress_y = y + text_distance
-        unique_tangomon = set(player_tangomon)
-        tangomon_caught = {}
-        for zone in ZONES:
-            tangomon_caught[zone] = len(unique_tangomon & tangomon_sets[zone])
-
         for i in range(len(self.zone_sprites)):
-            zone = ZONES[i]
-            zone_sprite = self.zone_sprites[i]
-            self.project_sprite(zone_sprite, 0, x, y, 0)
-            self.project_text(font, ZONE_NAMES[zone], x, name_y, 0,
-                              halign=sge.s.center, valign=sge.s.bottom)
-            caught = tangomon_caught[zone]
-            avail = len(tangomon_sets[zone])
-            prog_text = "{}/{} ({}%)".format(
-                caught, avail, int(100 * caught / avail))
-            self.project_text(font, prog_text, x, progress_y, 0,
-                              halign=sge.s.center, valign=sge.s.top)
+            self.project_sprite(self.zone_sprites[i], 0, x, y, 0)
+            self.project_sprite(self.name_sprites[i], 0, x, name_y, 0)
+            self.project_sprite(self.progress_sprites[i], 0, x, progress_y, 0)
             x += zone_distance
 
     def event_key_press(self, key, char):
-        global player_zone
 
         if key == sge.s.left:
-            play_sound(select_sound)
-            player_zone -= 1
-            player_zone %= len(ZONES)
+            play_sound("select")
+            core.player_zone -= 1
+            core.player_zone %= len(core.ZONES)
+            request_preload(core.ZONES[core.player_zone])
         elif key == sge.s.right:
-            play_sound(select_sound)
-            player_zone += 1
-            player_zone %= len(ZONES)
+            play_sound("select")
+            core.player_zone += 1
+            core.player_zone %= len(core.ZONES)
+            request_preload(core.ZONES[core.player_zone])
         elif key in {sge.s.enter, sge.s.kp_enter}:
-            zone = ZONES[player_zone]
-            tset = tangomon_sets[zone]
-
-            choices = list(tset)
-            new_choices = []
-            for tangomon in tset:
-                if tangomon not in player_tangomon:
-                    new_choices.append(tangomon)
-
-            if new_choices and get_player_active_tangokans():
-               tangomon = random.choice(new_choices)
-            else:
-               tangomon = random.choice(choices)
-
-            ect = tangomon_encountered[zone]
-            music = "battle.ogg"
-            if tangomon in ect:
-                if ect.index(tangomon) >= len(tset) - 1:
-                    music = "battle_dungeon.ogg"
-            elif len(ect) == len(tset) - 1:
-                music = "battle_dungeon.ogg"
-
-            arena = Arena(tangomon, zone, music=music)
+            zone = core.ZONES[core.player_zone]
+            tangomon, player, music = get_preloaded_battle(zone)
+            arena = Arena(tangomon, zone, player=player, music=music)
             arena.start()
         elif key in {sge.s.escape, sge.s.space, sge.s.tab, sge.s.backspace}:
             WorldmapMenu.create()
@@ -376,8 +504,10 @@ class Arena(Room):
 
     """Arena where monsters fight."""
 
-    def __init__(self, enemy, zone, **kwargs):
-        self.player = random.randrange(len(player_tangomon))
+    def __init__(self, enemy, zone, player=None, **kwargs):
+        if player is None:
+            player = random.randrange(len(core.player_tangomon))
+        self.player = player
         self.enemy = enemy
         self.tangoji = None
         self.tangoji_bonus = 0
@@ -387,13 +517,8 @@ class Arena(Room):
         self.player_ran = False
 
         layers = []
-        d = os.path.join(DATA, "images", "arenas")
-        try:
-            s = sge.gfx.Sprite(
-                zone, d, width=BG_WIDTH, height=BG_HEIGHT)
-        except OSError:
-            pass
-        else:
+        s = get_arena_sprite(zone)
+        if s is not None:
             x = (SCREEN_SIZE[0] - BG_WIDTH) / 2
             y = (SCREEN_SIZE[1] - BG_HEIGHT) / 2
             layers.append(sge.gfx.BackgroundLayer(s, x, y))
@@ -403,7 +528,6 @@ class Arena(Room):
         super(Arena, self).__init__(background=background, **kwargs)
 
     def event_room_start(self):
-        global player_tangomon
 
         super(Arena, self).event_room_start()
         self.add(gui_handler)
@@ -423,45 +547,43 @@ class Arena(Room):
 
         self.notification_text = ""
 
-        self.pt_name = player_tangomon[self.player]
-        self.player_name = get_tangomon_name(self.pt_name)
-        self.player_hp = get_tangomon_hp_buffed(self.pt_name)
-        self.player_base_power = get_tangomon_power_buffed(self.pt_name)
+        self.pt_name = core.player_tangomon[self.player]
+        self.player_name = core.get_tangomon_name(self.pt_name)
+        self.player_hp = core.get_tangomon_hp_buffed(self.pt_name)
+        self.player_base_power = core.get_tangomon_power_buffed(self.pt_name)
         player_sprite = get_tangomon_sprite(self.pt_name)
         y = self.real_height / 2 - player_sprite.height / 2
         self.player_object = sge.dsp.Object.create(
             padding, y, sprite=player_sprite, tangible=False)
-        self.enemy_name = get_tangomon_name(self.enemy)
-        self.enemy_hp = get_tangomon_hp_max(self.enemy)
-        self.enemy_base_power = get_tangomon_base_power(self.enemy)
-        enemy_sprite = get_tangomon_sprite(self.enemy).copy()
-        enemy_sprite.mirror()
+        self.enemy_name = core.get_tangomon_name(self.enemy)
+        self.enemy_hp = core.get_tangomon_hp_max(self.enemy)
+        self.enemy_base_power = core.get_tangomon_base_power(self.enemy)
+        enemy_sprite = get_tangomon_sprite(self.enemy, mirror=True)
         x = self.width - padding - enemy_sprite.width
         y = self.real_height / 2 - enemy_sprite.height / 2
         self.enemy_object = sge.dsp.Object.create(x, y, sprite=enemy_sprite,
                                                   tangible=False)
 
-        self.init_tangoject(BATTLE_START_WAIT)
+        self.init_tangoject(core.BATTLE_START_WAIT)
 
     def event_step(self, time_passed, delta_mult):
         if self.notification_text:
-            self.project_text(
-                font_big, self.notification_text, self.width / 2, 8, 0,
+            project_cached_text(
+                self, font_big, self.notification_text, self.width / 2, 8, 0,
                 width=self.width - 16, halign=sge.s.center)
 
         y = self.real_height - 8
-        self.project_text(font_big, str(self.player_hp), 8, y, 0,
-                          halign=sge.s.left, valign=sge.s.bottom)
-        self.project_text(font_big, str(self.enemy_hp), self.width - 8, y, 0,
-                          halign=sge.s.right, valign=sge.s.bottom)
-
-    def init_tangoject(self, wait_time=BATTLE_START_WAIT):
-        global player_tangojections
-
-        player_tangojections.sort(key=lambda d: d.get("time"))
-        if (player_tangojections and
-                player_tangojections[0].get("time", time.time()) <= time.time()):
-            self.tangoji = player_tangojections.pop(0)
+        project_cached_text(self, font_big, str(self.player_hp), 8, y, 0,
+                            halign=sge.s.left, valign=sge.s.bottom)
+        project_cached_text(self, font_big, str(self.enemy_hp),
+                            self.width - 8, y, 0, halign=sge.s.right,
+                            valign=sge.s.bottom)
+
+    def init_tangoject(self, wait_time=core.BATTLE_START_WAIT):
+
+        tangoji = core.player_tangojections.pop_due()
+        if tangoji is not None:
+            self.tangoji = tangoji
             self.alarms["init_tangoject"] = wait_time
         else:
             self.alarms["init_player_attack"] = wait_time
@@ -474,7 +596,7 @@ class Arena(Room):
         self.notification_text = ""
 
     def choose_tangoji(self):
-        self.tangoji = random.choice(player_tangojis)
+        self.tangoji = random.choice(core.player_tangojis)
 
     def show_clue(self):
         if self.tangoji is not None:
@@ -484,77 +606,47 @@ class Arena(Room):
 
     def evaluate_tangoji(self, time=0):
         if self.tangoji is not None and self.callback is not None:
-            word = self.tangoji.get("word", "")
-            self.tangoji.setdefault("power", TANGOJI_MULT_START)
-            if self.textbox.text.lower().strip() == word.lower().strip():
-                self.tangoji_bonus = self.tangoji["power"]
-                self.tangoji["power"] -= TANGOJI_MULT_DECREMENT
-                self.tangoji["power"] = max(self.tangoji["power"],
-                                            TANGOJI_MULT_MIN)
-
-                bulk_bonus = TANGOJI_MULT_BULK_BONUS * len(player_tangojis)
-                self.tangoji_bonus += bulk_bonus
-
-                if ("time_bonus" in self.alarms and
-                        self.alarms["time_bonus"] > 0):
-                    self.tangoji_bonus += (self.alarms["time_bonus"] *
-                                           TANGOJI_MULT_TIME_BONUS)
-                    del self.alarms["time_bonus"]
-            else:
-                self.tangoji["power"] += TANGOJI_MULT_DECREMENT
-                self.tangoji["power"] = min(self.tangoji["power"],
-                                            TANGOJI_MULT_START)
-                self.tangoji_bonus = 0
-
+            time_left = self.alarms.pop("time_bonus", 0)
+            self.tangoji_bonus = core.grade_tangoji(
+                self.tangoji, self.textbox.text, time_left)
             self.callback()
             self.callback = None
 
     def tangoject(self):
-        global player_tangojis
-        global player_tangojections
 
         self.reset_state()
 
         word = self.tangoji.get("word", "")
         if self.tangoji_bonus:
             self.test_num += 1
-            nt = self.tangoji.setdefault("next_time", DAY)
-            dev = random.uniform(-nt / 10, nt / 10)
-            self.tangoji["time"] = time.time() + nt + dev
-            self.tangoji["next_time"] *= 2
-            player_tangojections.append(self.tangoji)
-            player_tangojections.sort(key=lambda d: d.get("time"))
-
-            if (player_tangojections and self.test_num < TEST_LIMIT and
-                    player_tangojections[0].get("time", time.time()) <= time.time()):
-                self.init_tangoject(TEST_WAIT)
+            core.pass_tangojection(self.tangoji)
+
+            if (self.test_num < core.TEST_LIMIT and
+                    core.player_tangojections.peek_due() is not None):
+                self.init_tangoject(core.TEST_WAIT)
             else:
                 self.notification_text = _("You passed the test given to you by {tangomon}!").format(
                     tangomon=self.player_name)
-                self.alarms["init_player_attack"] = ATTACK_INTERVAL_TIME
-                play_sound(pass_test_sound)
+                self.alarms["init_player_attack"] = core.ATTACK_INTERVAL_TIME
+                play_sound("pass_test")
         else:
             self.notification_text = _("You failed the test given to you by {tangomon}! {tangomon} loses faith in you and \"{tangoji}\" is transformed back into a tangoji!").format(
                 tangomon=self.player_name, tangoji=word)
-            self.tangoji["power"] = TANGOJI_MULT_START
-            player_tangojis.append(self.tangoji)
-            self.alarms["player_lose"] = ATTACK_INTERVAL_FAIL_TIME
-            play_sound(fail_test_sound)
+            core.return_tangoji(self.tangoji)
+            self.alarms["player_lose"] = core.ATTACK_INTERVAL_FAIL_TIME
+            play_sound("fail_test")
 
     def player_attack(self):
-        global player_tangomon
 
         self.reset_state()
 
         word = self.tangoji.get("word", "")
         info = self.tangoji.get("info")
         if self.tangoji_bonus:
-            damage = int(self.player_base_power * self.tangoji_bonus)
-
-            # Critical hit
-            if random.random() < CRITICAL_CHANCE:
-                damage *= CRITICAL_MULT
-                play_sound(critical_sound)
+            damage, critical = core.get_attack_damage(
+                self.player_base_power, self.tangoji_bonus)
+            if critical:
+                play_sound("critical")
                 self.notification_text = _("{player} attacks with \"{tangoji}\", inflicting {damage} damage! It's super effective!").format(
                     player=self.player_name, tangoji=word, damage=damage)
             else:
@@ -563,17 +655,15 @@ class Arena(Room):
 
             self.enemy_hp -= damage
             self.enemy_object.image_alpha = 128
-            interval = ATTACK_INTERVAL_TIME
-            play_sound(hurt_sound)
+            interval = core.ATTACK_INTERVAL_TIME
+            play_sound("hurt")
         else:
-            damage = self.enemy_base_power * ENEMY_NERF
-            damage += random.uniform(-damage / 10, damage / 10)
-            damage = int(damage)
+            damage = core.get_counterattack_damage(self.enemy_base_power)
             self.player_hp -= damage
             self.player_object.image_alpha = 128
-            interval = ATTACK_INTERVAL_FAIL_TIME
-            play_sound(block_sound)
-            play_sound(hurt_sound)
+            interval = core.ATTACK_INTERVAL_FAIL_TIME
+            play_sound("block")
+            play_sound("hurt")
 
             if info:
                 self.notification_text = _("Attack failed! Correct Tangoji (\"{tangoji}\" ({info})) not entered. {enemy} counterattacks, inflicting {damage} damage.").format(
@@ -592,31 +682,23 @@ class Arena(Room):
             self.alarms["init_player_attack"] = interval
 
     def use_tangokan(self):
-        global player_tangomon
-        global player_tangojis
-        global player_tangojections
 
         self.reset_state()
 
         if self.tangoji_bonus:
-            interval = ATTACK_INTERVAL_TIME
-            player_tangomon.append(self.enemy)
-            tangoji = self.tangoji.copy()
-            wait = DAY
-            tangoji["time"] = time.time() + wait
-            tangoji["next_time"] = wait * 2
-            player_tangojections.append(tangoji)
+            interval = core.ATTACK_INTERVAL_TIME
+            core.add_player_tangomon(self.enemy)
+            core.start_tangojection(self.tangoji)
             self.notification_text = _("Impression succeeded! {tangomon} has joined your team!").format(
                 tangomon=self.enemy_name)
-            play_sound(pass_test_sound)
+            play_sound("pass_test")
         else:
-            interval = ATTACK_INTERVAL_FAIL_TIME
-            self.tangoji["power"] = TANGOJI_MULT_PERSISTENT_MIN
-            player_tangojis.append(self.tangoji)
+            interval = core.ATTACK_INTERVAL_FAIL_TIME
+            core.return_tangoji(self.tangoji, core.TANGOJI_MULT_PERSISTENT_MIN)
             self.enemy_run()
             self.notification_text = _("Impression failed! {tangomon} runs away, unimpressed, and your tangokan turns back into a tangoji!").format(
                 tangomon=self.enemy_name)
-            play_sound(fail_test_sound)
+            play_sound("fail_test")
 
         self.alarms["leave_arena"] = interval
 
@@ -636,25 +718,20 @@ class Arena(Room):
             tangomon=self.enemy_name)
 
     def end_battle(self):
-        global player_tangojis
 
         self.reset_state()
-
-        for tangoji in player_tangojis:
-            p = tangoji.get("power", TANGOJI_MULT_START)
-            tangoji["power"] = max(p, TANGOJI_MULT_PERSISTENT_MIN)
-
+        core.restore_tangoji_power()
         load_map()
 
     def terminate_game(self):
         if not self.player_ran:
-            assert len(player_tangomon) > self.player
+            assert len(core.player_tangomon) > self.player
             text = _("WARNING: If you leave this battle, you will lose your current tangomon! Are you sure?")
             buttons = [_("No"), _("Yes")]
             if xsge_gui.show_message(gui_handler, message=text, buttons=buttons):
                 self.reset_state()
                 self.player_ran = True
-                del player_tangomon[self.player]
+                core.remove_player_tangomon(self.player)
                 self.end_battle()
                 save_game()
                 sge.game.end()
@@ -667,7 +744,7 @@ class Arena(Room):
         if key in {sge.s.enter, sge.s.kp_enter}:
             self.evaluate_tangoji()
         elif key == sge.s.escape and not self.player_ran:
-            assert len(player_tangomon) > self.player
+            assert len(core.player_tangomon) > self.player
             text = _("WARNING: If you leave this battle, you will lose your current tangomon! Are you sure?")
             buttons = [_("No"), _("Yes")]
             if xsge_gui.show_message(gui_handler, message=text, buttons=buttons):
@@ -679,36 +756,36 @@ class Arena(Room):
         if alarm_id == "init_tangoject":
             self.show_clue()
             self.callback = self.tangoject
-            self.alarms["time_bonus"] = TANGOJI_ENTRY_TIME
+            self.alarms["time_bonus"] = core.TANGOJI_ENTRY_TIME
 
             if not self.tangoject_started:
-                play_sound(start_tangoject_sound)
+                play_sound("start_tangoject")
                 self.tangoject_started = True
         elif alarm_id == "init_player_attack":
             self.reset_state()
             self.choose_tangoji()
             self.show_clue()
             self.callback = self.player_attack
-            self.alarms["time_bonus"] = TANGOJI_ENTRY_TIME
-            play_sound(charge_sound)
+            self.alarms["time_bonus"] = core.TANGOJI_ENTRY_TIME
+            play_sound("charge")
         elif alarm_id == "player_lose":
             self.player_run()
-            del player_tangomon[self.player]
-            self.alarms["leave_arena"] = ATTACK_INTERVAL_TIME
+            core.remove_player_tangomon(self.player)
+            self.alarms["leave_arena"] = core.ATTACK_INTERVAL_TIME
         elif alarm_id == "player_win":
             self.reset_state()
 
-            tangokans = get_player_active_tangokans()
-            if tangokans and self.enemy not in player_tangomon:
+            tangokans = core.get_player_active_tangokans()
+            if tangokans and self.enemy not in core.player_tangomon:
                 i = random.choice(tangokans)
-                self.tangoji = player_tangokans.pop(i)
+                self.tangoji = core.player_tangokans.pop(i)
                 self.show_clue()
                 self.callback = self.use_tangokan
-                self.alarms["time_bonus"] = TANGOJI_ENTRY_TIME
-                play_sound(engage_tangokan_sound)
+                self.alarms["time_bonus"] = core.TANGOJI_ENTRY_TIME
+                play_sound("engage_tangokan")
             else:
                 self.enemy_run()
-                self.alarms["leave_arena"] = ATTACK_INTERVAL_TIME
+                self.alarms["leave_arena"] = core.ATTACK_INTERVAL_TIME
         elif alarm_id == "leave_arena":
             self.end_battle()
 
@@ -755,7 +832,7 @@ class CreditsScreen(sge.dsp.Room):
 
         if self.sections[-1].bbox_bottom < 0 and "end" not in self.alarms:
             sge.snd.Music.stop(fade_time=3000)
-            self.alarms["end"] = 3.5 * FPS
+            self.alarms["end"] = 3.5 * core.FPS
 
     def event_alarm(self, alarm_id):
         if alarm_id == "end":
@@ -850,7 +927,7 @@ class Menu(xsge_gui.MenuWindow):
             return self
 
     def event_change_keyboard_focus(self):
-        play_sound(select_sound)
+        play_sound("select")
 
 
 class MainMenu(Menu):
@@ -860,16 +937,16 @@ class MainMenu(Menu):
 
     def event_choose(self):
         if self.choice == 0:
-            play_sound(confirm_sound)
+            play_sound("confirm")
             NewGameMenu.create_page()
         elif self.choice == 1:
-            play_sound(confirm_sound)
+            play_sound("confirm")
             LoadGameMenu.create_page()
         elif self.choice == 2:
-            play_sound(confirm_sound)
+            play_sound("confirm")
             OptionsMenu.create_page()
         elif self.choice == 3:
-            play_sound(confirm_sound)
+            play_sound("confirm")
             credits_room = CreditsScreen()
             credits_room.start()
         else:
@@ -881,7 +958,7 @@ class NewGameMenu(Menu):
     @classmethod
     def create_page(cls, default=0):
         cls.items = []
-        for slot in save_slots:
+        for slot in core.save_slots:
             if slot is None:
                 cls.items.append(_("-Empty-"))
             else:
@@ -893,18 +970,17 @@ class NewGameMenu(Menu):
         return cls.create(default)
 
     def event_choose(self):
-        global current_save_slot
 
-        if self.choice in range(len(save_slots)):
-            play_sound(confirm_sound)
-            current_save_slot = self.choice
-            if save_slots[current_save_slot] is None:
+        if self.choice in range(len(core.save_slots)):
+            play_sound("confirm")
+            core.current_save_slot = self.choice
+            if core.save_slots[core.current_save_slot] is None:
                 new_game()
                 load_map()
             else:
                 OverwriteConfirmMenu.create(default=1)
         else:
-            play_sound(cancel_sound)
+            play_sound("cancel")
             MainMenu.create(default=0)
 
 
@@ -914,27 +990,26 @@ class OverwriteConfirmMenu(Menu):
 
     def event_choose(self):
         if self.choice == 0:
-            play_sound(confirm_sound)
+            play_sound("confirm")
             new_game()
             load_map()
         else:
-            play_sound(cancel_sound)
-            NewGameMenu.create(default=current_save_slot)
+            play_sound("cancel")
+            NewGameMenu.create(default=core.current_save_slot)
 
 
 class LoadGameMenu(NewGameMenu):
 
     def event_choose(self):
-        global current_save_slot
 
-        if self.choice in range(len(save_slots)):
-            play_sound(confirm_sound)
-            current_save_slot = self.choice
-            if not load_game():
+        if self.choice in range(len(core.save_slots)):
+            play_sound("confirm")
+            core.current_save_slot = self.choice
+            if not core.load_game():
                 new_game()
             load_map()
         else:
-            play_sound(cancel_sound)
+            play_sound("cancel")
             MainMenu.create(default=1)
 
 
@@ -962,7 +1037,7 @@ class OptionsMenu(Menu):
         global joystick_threshold
 
         if self.choice == 0:
-            play_sound(select_sound)
+            play_sound("select")
             fullscreen = not fullscreen
             sge.game.fullscreen = fullscreen
             OptionsMenu.create_page(default=self.choice)
@@ -973,7 +1048,7 @@ class OptionsMenu(Menu):
             else:
                 i = 0
 
-            play_sound(select_sound)
+            play_sound("select")
             i += 1
             i %= len(choices)
             scale_method = choices[i]
@@ -981,21 +1056,23 @@ class OptionsMenu(Menu):
             OptionsMenu.create_page(default=self.choice)
         elif self.choice == 2:
             sound_enabled = not sound_enabled
-            play_sound(confirm_sound)
+            play_sound("confirm")
+            if sound_enabled and sound_warm_up:
+                sound_bank.start_warm_up()
             OptionsMenu.create_page(default=self.choice)
         elif self.choice == 3:
             music_enabled = not music_enabled
             play_music(sge.game.current_room.music)
             OptionsMenu.create_page(default=self.choice)
         elif self.choice == 4:
-            play_sound(select_sound)
+            play_sound("select")
             fps_enabled = not fps_enabled
             OptionsMenu.create_page(default=self.choice)
         elif self.choice == 5:
             FontChooser(gui_handler).show()
             OptionsMenu.create_page(default=self.choice)
         else:
-            play_sound(cancel_sound)
+            play_sound("cancel")
             write_to_disk()
             MainMenu.create(default=2)
 
@@ -1020,64 +1097,77 @@ class ModalMenu(xsge_gui.MenuDialog):
             return self
 
     def event_change_keyboard_focus(self):
-        play_sound(select_sound)
+        play_sound("select")
 
 
 class WorldmapMenu(ModalMenu):
 
     items = [_("Continue Game"), _("View Statistics"), _("View Tangomon"),
-             _("View Tangoji"), _("Add Tangoji"), _("Change Tangoji"),
-             _("Create Tangokan"), _("Reset Game"),
-             _("Return to Title Screen")]
+             _("View Tangoji"), _("Find Tangoji"), _("Add Tangoji"),
+             _("Import Tangojis"), _("Change Tangoji"), _("Create Tangokan"),
+             _("Reset Game"), _("Return to Title Screen")]
 
     def event_choose(self):
         if self.choice == 1:
-            unique_tangomon = set(player_tangomon)
+            unique_tangomon = set(core.player_tangomon)
             my_tangomon = len(unique_tangomon)
-            active_tangokans = len(get_player_active_tangokans())
-            text = _("PLAYER STATISTICS\n\nName: {name}\nTotal tangomon: {tangomon}\nTangomon types: {unique_tangomon}\nActive tangoji: {tangoji}\nActive tangokans: {tangokans}\nInactive tangokans: {inactive_tangokans}\nCompletion: {completion}%").format(
-                name=player_name, tangomon=len(player_tangomon),
-                unique_tangomon=my_tangomon, tangoji=len(player_tangojis),
+            active_tangokans = len(core.get_player_active_tangokans())
+            forecast = core.forecast_reviews(STATS_FORECAST_DAYS)
+            text = _("PLAYER STATISTICS\n\nName: {name}\nTotal tangomon: {tangomon}\nTangomon types: {unique_tangomon}\nActive tangoji: {tangoji}\nActive tangokans: {tangokans}\nInactive tangokans: {inactive_tangokans}\nCompletion: {completion}%\nTests due today: {due_today}\nTests due in the next {days} days: {due_later} (at most {due_peak} in a day)").format(
+                name=core.player_name, tangomon=len(core.player_tangomon),
+                unique_tangomon=my_tangomon, tangoji=len(core.player_tangojis),
                 tangokans=active_tangokans,
-                inactive_tangokans=(len(player_tangokans) - active_tangokans),
-                completion=int(100 * my_tangomon / len(get_all_tangomon())))
+                inactive_tangokans=(len(core.player_tangokans) -
+                                    active_tangokans),
+                completion=int(100 * my_tangomon /
+                               len(core.get_all_tangomon())),
+                due_today=forecast[0], days=STATS_FORECAST_DAYS,
+                due_later=sum(forecast), due_peak=max(forecast))
 
             DialogBox(gui_handler, text).show()
             WorldmapMenu.create(default=self.choice)
         elif self.choice == 2:
-            play_sound(confirm_sound)
+            play_sound("confirm")
             TangomonInfo().show()
         elif self.choice == 3:
-            play_sound(confirm_sound)
+            play_sound("confirm")
             TangojiMenu.create_page()
         elif self.choice == 4:
-            play_sound(confirm_sound)
-            add_player_tangoji()
+            play_sound("confirm")
+            find_player_tangoji()
             WorldmapMenu.create(default=self.choice)
         elif self.choice == 5:
-            play_sound(confirm_sound)
-            ChangeTangojiMenu.create_page()
+            play_sound("confirm")
+            add_player_tangoji()
+            WorldmapMenu.create(default=self.choice)
         elif self.choice == 6:
-            play_sound(confirm_sound)
-            if len(player_tangojis) > TANGOJI_MIN:
-                play_sound(confirm_sound)
+            play_sound("confirm")
+            import_player_tangojis()
+            WorldmapMenu.create(default=self.choice)
+        elif self.choice == 7:
+            play_sound("confirm")
+            ChangeTangojiMenu.create_page()
+        elif self.choice == 8:
+            play_sound("confirm")
+            if len(core.player_tangojis) > core.TANGOJI_MIN:
+                play_sound("confirm")
                 CreateTangokanMenu.create_page()
             else:
-                msg = _("You don't have enough tangojis in reserve to make a tangokan. You can only create a tangokan if, after spending one of your tangojis to make the tangokan, you have at least {minimum} left over. You can create more tangojis with the \"Add Tangoji\" option.").format(minimum=TANGOJI_MIN)
+                msg = _("You don't have enough tangojis in reserve to make a tangokan. You can only create a tangokan if, after spending one of your tangojis to make the tangokan, you have at least {minimum} left over. You can create more tangojis with the \"Add Tangoji\" option.").format(minimum=core.TANGOJI_MIN)
                 DialogBox(gui_handler, msg).show()
                 WorldmapMenu.create(default=self.choice)
-        elif self.choice == 7:
+        elif self.choice == 9:
             text = _("This will only reset your location and tangomon. Are you sure?")
             buttons = [_("No"), _("Yes")]
             if xsge_gui.show_message(gui_handler, message=text, buttons=buttons):
                 reset_game()
             else:
                 WorldmapMenu.create(default=self.choice)
-        elif self.choice == 8:
+        elif self.choice == 10:
             save_game()
             sge.game.start_room.start()
         else:
-            play_sound(cancel_sound)
+            play_sound("cancel")
 
 
 class TangojiMenu(ModalMenu):
@@ -1089,18 +1179,18 @@ class TangojiMenu(ModalMenu):
     def create_page(cls, default=0, page=0, refreshlist=False):
         cls.current_tangoji = []
         cls.items = []
-        if player_tangojis:
+        if core.player_tangojis:
             page_size = TANGOJI_LIST_SIZE
-            n_pages = math.ceil(len(player_tangojis) / page_size)
+            n_pages = math.ceil(len(core.player_tangojis) / page_size)
             page = int(page % n_pages)
             page_start = page * page_size
-            page_end = min(page_start + page_size, len(player_tangojis))
+            page_end = min(page_start + page_size, len(core.player_tangojis))
             current_page = range(page_start, page_end)
             cls.current_tangoji = []
             cls.items = []
             for i in current_page:
                 cls.current_tangoji.append(i)
-                word = player_tangojis[i].get("word", "???")
+                word = core.player_tangojis[i].get("word", "???")
                 cls.items.append(word)
 
         cls.items.append(_("Next page"))
@@ -1111,23 +1201,24 @@ class TangojiMenu(ModalMenu):
 
     def event_choose(self):
         if self.choice == len(self.items) - 2:
-            play_sound(select_sound)
+            play_sound("select")
             self.create_page(default=-2, page=(self.page + 1))
         elif self.choice is not None and self.choice < len(self.items) - 2:
-            play_sound(confirm_sound)
+            play_sound("confirm")
             i = self.current_tangoji[self.choice]
-            word = player_tangojis[i].get("word", "???")
-            clue = player_tangojis[i].get("clue", "???")
-            info = player_tangojis[i].get("info")
+            word = core.player_tangojis[i].get("word", "???")
+            clue = core.player_tangojis[i].get("clue", "???")
+            info = core.player_tangojis[i].get("info")
             if not info:
                 info = _("N/A")
-            power = player_tangojis[i].get("power", TANGOJI_MULT_START)
+            power = core.player_tangojis[i].get("power",
+                                                core.TANGOJI_MULT_START)
             text = _("{word}\n\n{clue}\n\nInfo: {info}\n\nPower: {power}%").format(
                 word=word, info=info, clue=clue, power=int(power * 100))
             DialogBox(gui_handler, text).show()
             self.create_page(default=self.choice, page=self.page)
         else:
-            play_sound(cancel_sound)
+            play_sound("cancel")
             WorldmapMenu.create(default=3)
 
 
@@ -1135,67 +1226,74 @@ class ChangeTangojiMenu(TangojiMenu):
 
     def event_choose(self):
         if self.choice == len(self.items) - 2:
-            play_sound(select_sound)
+            play_sound("select")
             self.create_page(default=-2, page=(self.page + 1))
         elif self.choice is not None and self.choice < len(self.items) - 2:
-            play_sound(confirm_sound)
-            i = self.current_tangoji[self.choice]
+            play_sound("confirm")
+            tangoji = core.player_tangojis[self.current_tangoji[self.choice]]
             text = _("Enter your desired changes to this tangoji.")
-            word = player_tangojis[i].get("word") or ""
+            word = tangoji.get("word") or ""
             tangoji_word = xsge_gui.get_text_entry(gui_handler, message=text,
                                                    text=word)
-            if tangoji_word:
-                player_tangojis[i]["word"] = tangoji_word
 
             text = _("Enter your desired changes to this tangoji's clue.")
-            clue = player_tangojis[i].get("clue") or ""
+            clue = tangoji.get("clue") or ""
             tangoji_clue = xsge_gui.get_text_entry(gui_handler, message=text,
                                                    text=clue)
 
             text = _("Enter your desired changes to this tangoji's extra information.")
-            info = player_tangojis[i].get("info") or ""
+            info = tangoji.get("info") or ""
             tangoji_info = xsge_gui.get_text_entry(gui_handler, message=text,
                                                    text=info)
 
-            if tangoji_info is not None:
-                player_tangojis[i]["info"] = tangoji_info
-            if tangoji_clue:
-                player_tangojis[i]["clue"] = tangoji_clue
-
-            WorldmapMenu.create(default=5)
+            new_word = tangoji_word or word
+            new_clue = tangoji_clue or clue
+            others = [t for t in core.tangoji_index.find(new_word, new_clue)
+                      if t is not tangoji]
+            if others:
+                text = _("You already have the tangoji \"{tangoji}\" with that clue.").format(
+                    tangoji=new_word)
+                DialogBox(gui_handler, text).show()
+                tangoji_word = None
+                tangoji_clue = None
+
+            core.change_tangoji(tangoji, word=tangoji_word or None,
+                                clue=tangoji_clue or None, info=tangoji_info)
+
+            WorldmapMenu.create(default=7)
         else:
-            play_sound(cancel_sound)
-            WorldmapMenu.create(default=5)
+            play_sound("cancel")
+            WorldmapMenu.create(default=7)
 
 
 class CreateTangokanMenu(TangojiMenu):
 
     def event_choose(self):
         if self.choice == len(self.items) - 2:
-            play_sound(select_sound)
+            play_sound("select")
             self.create_page(default=-2, page=(self.page + 1))
         elif self.choice is not None and self.choice < len(self.items) - 2:
-            play_sound(confirm_sound)
+            play_sound("confirm")
             i = self.current_tangoji[self.choice]
-            tangoji = player_tangojis.pop(i)
-            make_tangokan(tangoji)
+            tangoji = core.player_tangojis.pop(i)
+            core.make_tangokan(tangoji)
             msg = _("New tangokan created! It will activate in 12 hours. At that point, you will be able to use your tangokan to convince a new tangomon to join your team!")
             DialogBox(gui_handler, msg).show()
-            WorldmapMenu.create(default=6)
+            WorldmapMenu.create(default=8)
         else:
-            play_sound(cancel_sound)
-            WorldmapMenu.create(default=6)
+            play_sound("cancel")
+            WorldmapMenu.create(default=8)
 
 
 class TangomonInfo(xsge_gui.Dialog):
 
     def set_tangomon(self, tangomon=0):
-        self.tangomon = tangomon % len(player_tangomon)
-        iname = player_tangomon[self.tangomon]
-        name = get_tangomon_name(iname)
+        self.tangomon = tangomon % len(core.player_tangomon)
+        iname = core.player_tangomon[self.tangomon]
+        name = core.get_tangomon_name(iname)
         sprite = get_tangomon_sprite(iname)
-        hp = get_tangomon_hp_buffed(iname)
-        base_power = get_tangomon_power_buffed(iname)
+        hp = core.get_tangomon_hp_buffed(iname)
+        base_power = core.get_tangomon_power_buffed(iname)
 
         padding = 8
 
@@ -1211,10 +1309,8 @@ class TangomonInfo(xsge_gui.Dialog):
 
         y += sprite.height + padding
         zone = "N/A"
-        for i in tangomon_sets:
-            if iname in tangomon_sets[i]:
-                zone = ZONE_NAMES[i]
-                break
+        if iname in core.tangomon_index:
+            zone = ZONE_NAMES[core.tangomon_index[iname][0]]
         self.info_label.text = _("Zone: {zone}\nHP: {hp}\nPower: {power}").format(
             zone=zone, hp=hp, power=int(base_power))
         self.info_label.y = y
@@ -1230,7 +1326,7 @@ class TangomonInfo(xsge_gui.Dialog):
             self, self.width / 2, 0, 10, "NULL", font=font_big,
             width=(self.width - 2 * padding), halign=sge.s.center)
         self.sprite_widget = xsge_gui.DecorativeWidget(
-            self, self.width / 2 - sprite.width / 2, 0, 10)
+            self, self.width / 2, 0, 10)
         self.info_label = xsge_gui.Label(
             self, self.width / 2, 0, 10, "(NULL)", font=font_big,
             width=(self.width - 2 * padding), halign=sge.s.center)
@@ -1238,28 +1334,224 @@ class TangomonInfo(xsge_gui.Dialog):
         self.set_tangomon(tangomon)
 
     def event_press_left(self):
-        play_sound(select_sound)
+        play_sound("select")
         self.set_tangomon(self.tangomon - 1)
 
     def event_press_right(self):
-        play_sound(select_sound)
+        play_sound("select")
         self.set_tangomon(self.tangomon + 1)
 
     def event_press_enter(self):
         self.destroy()
         sge.game.refresh()
-        play_sound(cancel_sound)
+        play_sound("cancel")
         WorldmapMenu.create(default=2)
 
     def event_press_escape(self):
         self.event_press_enter()
 
 
+class SpriteCache(object):
+
+    """
+    Least-recently-used cache of sprites.
+
+    Once the estimated memory taken up by the cached images exceeds
+    ``budget`` bytes, the sprites used longest ago are dropped.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self.sprites = collections.OrderedDict()
+        self.lock = threading.RLock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.sprites.get(key)
+            if entry is None:
+                return None
+
+            self.sprites.move_to_end(key)
+            return entry[0]
+
+    def add(self, key, sprite):
+        with self.lock:
+            self.remove(key)
+            size = 4 * sprite.width * sprite.height * max(1, sprite.frames)
+            self.sprites[key] = (sprite, size)
+            self.size += size
+
+            # Always keep the newest sprite, even if it alone is over
+            # budget.
+            while self.size > self.budget and len(self.sprites) > 1:
+                _, old_size = self.sprites.popitem(last=False)[1]
+                self.size -= old_size
+
+    def remove(self, key):
+        with self.lock:
+            entry = self.sprites.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.sprites.clear()
+            self.size = 0
+
+
+class MusicManager(object):
+
+    """
+    Loader for the music in a directory.
+
+    The directory is only listed once, so a file that isn't there (such
+    as a missing start piece) is never looked for again.  Loaded music
+    is kept until the files it was loaded from add up to more than
+    ``budget`` bytes, at which point the least recently used music that
+    isn't playing is dropped.
+    """
+
+    def __init__(self, directory, budget):
+        self.directory = directory
+        self.budget = budget
+        self.files = None
+        self.loaded = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.RLock()
+
+    def index(self):
+        self.files = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            self.files[entry.name] = entry.stat().st_size
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+    def get(self, music):
+        # Return the music object for the file called music, or None if
+        # there is no such file or it can't be loaded.
+        with self.lock:
+            if self.files is None:
+                self.index()
+
+            entry = self.loaded.get(music)
+            if entry is not None:
+                self.loaded.move_to_end(music)
+                return entry[0]
+
+            size = self.files.get(music)
+            if size is None:
+                return None
+
+            try:
+                music_object = sge.snd.Music(os.path.join(self.directory,
+                                                          music))
+            except OSError:
+                del self.files[music]
+                return None
+
+            self.loaded[music] = (music_object, size)
+            self.size += size
+            for name in list(self.loaded):
+                if self.size <= self.budget:
+                    break
+                old_object, old_size = self.loaded[name]
+                if name != music and not old_object.playing:
+                    del self.loaded[name]
+                    self.size -= old_size
+
+            return music_object
+
+    def prefetch(self, music):
+        """Load the given music file and its start piece, if any."""
+        self.get(music)
+        self.get(get_music_start(music))
+
+
+class SoundBank(object):
+
+    """
+    Sound effects in a directory, registered by name (the file name
+    without its extension).  A sound is only decoded the first time it
+    is asked for, and :meth:`start_warm_up` can be used to decode the
+    rest in the background.
+    """
+
+    def __init__(self, directory, volumes=None):
+        self.directory = directory
+        self.volumes = volumes or {}
+        self.files = None
+        self.sounds = {}
+        self.lock = threading.Lock()
+        self.warm_up_thread = None
+
+    def index(self):
+        self.files = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in sorted(entries, key=lambda e: e.name):
+                    name, ext = os.path.splitext(entry.name)
+                    if ext.lower() in SOUND_EXTENSIONS:
+                        self.files.setdefault(name, entry.path)
+        except OSError:
+            pass
+
+    def get(self, name):
+        # Return the sound object for the sound called name, or None if
+        # there is no such sound or it can't be loaded.
+        with self.lock:
+            if self.files is None:
+                self.index()
+
+            if name in self.sounds:
+                return self.sounds[name]
+
+            path = self.files.get(name)
+            if path is None:
+                return None
+
+        # Decoding is slow, so it is done without the lock; if the
+        # warm-up thread decodes the same sound meanwhile, the first one
+        # stored is kept.
+        try:
+            sound = sge.snd.Sound(path, volume=self.volumes.get(name, 1))
+        except OSError:
+            sound = None
+
+        with self.lock:
+            return self.sounds.setdefault(name, sound)
+
+    def warm_up(self):
+        """Decode every registered sound while sound is enabled."""
+        with self.lock:
+            if self.files is None:
+                self.index()
+            names = list(self.files)
+
+        for name in names:
+            if not sound_enabled:
+                break
+            self.get(name)
+
+    def start_warm_up(self):
+        """Run :meth:`warm_up` in a background thread."""
+        if self.warm_up_thread is None or not self.warm_up_thread.is_alive():
+            self.warm_up_thread = threading.Thread(target=self.warm_up,
+                                                   daemon=True)
+            self.warm_up_thread.start()
+
+
 class DialogLabel(xsge_gui.ProgressiveLabel):
 
     def event_add_character(self):
         if self.text[-1] not in (' ', '\n', '\t'):
-            play_sound(type_sound)
+            play_sound("type")
 
 
 class DialogBox(xsge_gui.Dialog):
@@ -1306,128 +1598,43 @@ class DialogBox(xsge_gui.Dialog):
         self.destroy()
 
 
-def get_tangomon_name(tangomon):
-    return tangomon.replace("_", " ").title()
-
-
-def get_all_tangomon():
-    all_tangomon = set()
-    for i in tangomon_sets:
-        all_tangomon |= tangomon_sets[i]
-    return all_tangomon
-
-
-def get_player_unique_tangomon():
-    return list(set(player_tangomon))
-
-
-def get_player_active_tangokans():
-    active_tangokans = []
-    for i in range(len(player_tangokans)):
-        tangokan = player_tangokans[i]
-        tangokan.setdefault("active_time", time.time() + TANGOKAN_WAIT_TIME)
-        if time.time() >= tangokan["active_time"]:
-            active_tangokans.append(i)
-
-    return active_tangokans
-
-
-def make_tangokan(tangoji):
-    global player_tangokans
-
-    tangokan = tangoji.copy()
-    tangokan["active_time"] = time.time() + TANGOKAN_WAIT_TIME
-    player_tangokans.append(tangokan)
-
-
-def get_tangomon_sprite(tangomon):
-    for i in tangomon_sets:
-        if tangomon in tangomon_sets[i]:
-            d = os.path.join(DATA, "images", "tangomon", i)
-            return sge.gfx.Sprite(tangomon, d)
-
-    warnings.warn('"{}" is not a valid Tangomon.'.format(tangomon))
-    return None
-
+def get_tangomon_sprite(tangomon, mirror=False):
+    sprite = tangomon_sprite_cache.get((tangomon, mirror))
+    if sprite is not None:
+        return sprite
 
-def evaluate_tangomon(tangomon):
-    for i in tangomon_sets:
-        if tangomon in tangomon_sets[i]:
-            assert i in tangomon_encountered
-            tangomon_encountered[i].append(tangomon)
-            return
-
-    warnings.warn('"{}" is not a valid Tangomon.'.format(tangomon))
-
-
-def get_tangomon_hp_max(tangomon):
-    for i in tangomon_sets:
-        if tangomon in tangomon_sets[i]:
-            assert i in ZONES and i in tangomon_encountered
-            if tangomon not in tangomon_encountered[i]:
-                tangomon_encountered[i].append(tangomon)
-
-            j = tangomon_encountered[i].index(tangomon)
-            for k in ZONES[:ZONES.index(i)]:
-                j += len(tangomon_sets[i]) + ZONE_BUFFER
-            return int(HEALTH_MAX_START * (HEALTH_INCREMENT_FACTOR ** j))
-
-    warnings.warn('"{}" is not a valid Tangomon.'.format(tangomon))
-    return 1
-
-
-def get_tangomon_base_power(tangomon):
-    for i in tangomon_sets:
-        if tangomon in tangomon_sets[i]:
-            assert i in ZONES and i in tangomon_encountered
-            if tangomon not in tangomon_encountered[i]:
-                tangomon_encountered[i].append(tangomon)
-
-            j = tangomon_encountered[i].index(tangomon)
-            for k in ZONES[:ZONES.index(i)]:
-                j += len(tangomon_sets[i]) + ZONE_BUFFER
-            return BASE_POWER_START * (BASE_POWER_INCREMENT_FACTOR ** j)
-
-    warnings.warn('"{}" is not a valid Tangomon.'.format(tangomon))
-    return 1
-
-
-def get_tangomon_hp_buffed(tangomon):
-    # HP of a player's tangomon, buffed by its peers.
-    hp = get_tangomon_hp_max(tangomon)
-    n = 0
-    total_hp = 0
-    for s in set(player_tangomon):
-        ihp = get_tangomon_hp_max(s)
-        if ihp >= hp:
-            total_hp += ihp
-            n += 1
-    if n:
-        avg_hp = int(total_hp / n)
-        hp = max(hp, avg_hp)
+    if mirror:
+        sprite = get_tangomon_sprite(tangomon)
+        if sprite is None:
+            return None
 
-    return hp
+        sprite = sprite.copy()
+        sprite.mirror()
+        tangomon_sprite_cache.add((tangomon, mirror), sprite)
+        return sprite
 
+    entry = core.tangomon_catalog.get(tangomon)
+    if entry is None:
+        warnings.warn('"{}" is not a valid Tangomon.'.format(tangomon))
+        return None
 
-def get_tangomon_power_buffed(tangomon):
-    # HP of a player's tangomon, buffed by its peers.
-    power = get_tangomon_base_power(tangomon)
-    n = 0
-    total_power = 0
-    for s in set(player_tangomon):
-        ipower = get_tangomon_base_power(s)
-        if ipower >= power:
-            total_power += ipower
-            n += 1
-    if n:
-        avg_power = int(total_power / n)
-        power = max(power, avg_power)
+    # The catalog only knows the file exists; the image is decoded here
+    # for the first time, so a broken file can still turn up.
+    d = os.path.join(DATA, "images", "tangomon", entry["zone"])
+    try:
+        sprite = sge.gfx.Sprite(tangomon, d)
+    except OSError:
+        warnings.warn('Could not load the sprite for "{}".'.format(tangomon))
+        size = UNKNOWN_TANGOMON_SIZE
+        sprite = sge.gfx.Sprite(width=size, height=size)
+        sprite.draw_text(font_big, "?", size / 2, size / 2,
+                         halign=sge.s.center, valign=sge.s.middle)
 
-    return power
+    tangomon_sprite_cache.add((tangomon, mirror), sprite)
+    return sprite
 
 
 def add_player_tangoji():
-    global player_tangojis
 
     text = _("Enter your new tangoji.")
     tangoji_word = xsge_gui.get_text_entry(gui_handler, message=text)
@@ -1435,46 +1642,106 @@ def add_player_tangoji():
         text = _("Enter the clue for your new tangoji.")
         tangoji_clue = xsge_gui.get_text_entry(gui_handler, message=text)
         if tangoji_clue:
+            if core.tangoji_index.find(tangoji_word, tangoji_clue):
+                text = _("You already have the tangoji \"{tangoji}\" with that clue.").format(
+                    tangoji=tangoji_word)
+                DialogBox(gui_handler, text).show()
+                return False
+
             text = _("Enter any extra information for your new tangoji (optional).")
             tangoji_info = xsge_gui.get_text_entry(gui_handler, message=text)
-            player_tangojis.append({"word": tangoji_word, "clue": tangoji_clue,
-                                    "info": tangoji_info})
+            core.add_player_tangoji(tangoji_word, tangoji_clue, tangoji_info)
             return True
 
     return False
 
 
+def find_player_tangoji():
+    text = _("Enter the tangoji or clue to look for.")
+    query = xsge_gui.get_text_entry(gui_handler, message=text)
+    if query:
+        results = core.tangoji_index.search(query)
+        if results:
+            lines = []
+            for tangoji in results:
+                if tangoji.get("info"):
+                    lines.append(_("{tangoji}: {clue} ({info})").format(
+                        tangoji=tangoji["word"], clue=tangoji["clue"],
+                        info=tangoji["info"]))
+                else:
+                    lines.append(_("{tangoji}: {clue}").format(
+                        tangoji=tangoji["word"], clue=tangoji["clue"]))
+            text = "\n".join(lines)
+        else:
+            text = _("You don't have any tangoji with that word or clue.")
+        DialogBox(gui_handler, text).show()
+
+
+def import_tangojis_file(path):
+    """
+    Add the tangojis listed in the file at ``path``, or in standard
+    input if ``path`` is "-", to the player's tangojis and return a
+    report of how it went.  OSError or ValueError is raised if the file
+    can't be read.
+    """
+    start = time.perf_counter()
+    if path == "-":
+        # Read standard input the same way as a file: without newline
+        # translation, which the csv module needs for quoted newlines.
+        f = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig",
+                             newline="")
+        try:
+            added, duplicates, invalid = core.import_tangojis(f)
+        finally:
+            f.detach()
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            added, duplicates, invalid = core.import_tangojis(f)
+    elapsed = time.perf_counter() - start
+
+    lines = added + duplicates + invalid
+    return _("Added {added} tangojis. Skipped {duplicates} that you already have and {invalid} lines without a tangoji and clue. Read {lines} lines in {seconds:.2f} seconds ({rate:.0f} per second).").format(
+        added=added, duplicates=duplicates, invalid=invalid, lines=lines,
+        seconds=elapsed, rate=lines / max(elapsed, 1e-6))
+
+
+def import_player_tangojis():
+    text = _("Enter the path of the file to import tangojis from. Each line must have a tangoji, its clue and optionally extra information, separated by tabs or commas as in CSV files and Anki text exports.")
+    path = xsge_gui.get_text_entry(gui_handler, message=text)
+    if path:
+        try:
+            text = import_tangojis_file(os.path.expanduser(path))
+        except (OSError, ValueError) as e:
+            text = _("Could not import the tangojis: {}").format(e)
+        DialogBox(gui_handler, text).show()
+        return True
+
+    return False
+
+
 def play_sound(sound, x=None, y=None, force=True):
+    """Play the sound called ``sound`` from the sound bank."""
     if sound_enabled and sound:
-        sound.play(force=force)
+        sound_object = sound_bank.get(sound)
+        if sound_object is not None:
+            sound_object.play(force=force)
+
+
+def get_music_start(music):
+    name, ext = os.path.splitext(music)
+    return ''.join([name, "-start", ext])
 
 
 def play_music(music, force_restart=False):
     """Play the given music file, starting with its start piece."""
     if music_enabled and music:
-        music_object = loaded_music.get(music)
+        music_object = music_manager.get(music)
         if music_object is None:
-            try:
-                music_object = sge.snd.Music(os.path.join(DATA, "music",
-                                                          music))
-            except OSError:
-                sge.snd.Music.clear_queue()
-                sge.snd.Music.stop()
-                return
-            else:
-                loaded_music[music] = music_object
+            sge.snd.Music.clear_queue()
+            sge.snd.Music.stop()
+            return
 
-        name, ext = os.path.splitext(music)
-        music_start = ''.join([name, "-start", ext])
-        music_start_object = loaded_music.get(music_start)
-        if music_start_object is None:
-            try:
-                music_start_object = sge.snd.Music(os.path.join(DATA, "music",
-                                                                music_start))
-            except OSError:
-                pass
-            else:
-                loaded_music[music_start] = music_start_object
+        music_start_object = music_manager.get(get_music_start(music))
 
         if (force_restart or (not music_object.playing and
                               (music_start_object is None or
@@ -1491,11 +1758,155 @@ def play_music(music, force_restart=False):
         sge.snd.Music.stop()
 
 
+def get_arena_sprite(zone):
+    # Background sprite of zone's arena, or None if it has none.
+    with arena_sprites_lock:
+        if zone in arena_sprites:
+            return arena_sprites[zone]
+
+    # The preload thread may be loading the same sprite; whichever is
+    # done first is kept.
+    d = os.path.join(DATA, "images", "arenas")
+    try:
+        sprite = sge.gfx.Sprite(zone, d, width=BG_WIDTH, height=BG_HEIGHT)
+    except OSError:
+        sprite = None
+
+    with arena_sprites_lock:
+        return arena_sprites.setdefault(zone, sprite)
+
+
+def get_battle_music(zone, tangomon):
+    tset = core.tangomon_sets[zone]
+    ect_index = core.tangomon_encountered_index[zone]
+    if tangomon in ect_index:
+        if ect_index[tangomon] >= len(tset) - 1:
+            return "battle_dungeon.ogg"
+    elif len(core.tangomon_encountered[zone]) == len(tset) - 1:
+        return "battle_dungeon.ogg"
+
+    return "battle.ogg"
+
+
+def pick_battle(zone):
+    # Pick the enemy, the player's tangomon (as an index into
+    # player_tangomon) and the music of the next battle in zone.
+    tangomon = random.choice(core.get_zone_tangomon_choices(zone))
+    player = random.randrange(len(core.player_tangomon))
+    return tangomon, player, get_battle_music(zone, tangomon)
+
+
+def get_preloaded_battle(zone):
+    """
+    Return the enemy, the player's tangomon and the music of the battle
+    about to be fought in ``zone``: the ones picked for the last
+    preload if they still fit, or else a new pick.
+    """
+    global preloaded_battle
+
+    battle = preloaded_battle
+    preloaded_battle = None
+    if battle is not None and battle[0] == zone:
+        tangomon, player, music = battle[1:]
+        if (tangomon in core.get_zone_tangomon_choices(zone) and
+                player < len(core.player_tangomon)):
+            return tangomon, player, music
+
+    return pick_battle(zone)
+
+
+def request_preload(zone):
+    """
+    Pick the next battle in ``zone`` and have what it needs loaded in
+    the background: the arena background, the music and the sprites of
+    both tangomon.  A new request replaces any older one that has not
+    been started on yet.
+    """
+    global preload_thread
+    global pending_preload
+    global preloaded_battle
+
+    tangomon, player, music = pick_battle(zone)
+    preloaded_battle = (zone, tangomon, player, music)
+
+    with preload_condition:
+        pending_preload = (zone, tangomon, core.player_tangomon[player],
+                           music)
+        preload_condition.notify_all()
+
+    if preload_thread is None or not preload_thread.is_alive():
+        preload_thread = threading.Thread(target=run_preload_thread,
+                                          daemon=True)
+        preload_thread.start()
+
+
+def run_preload_thread():
+    global pending_preload
+
+    while True:
+        with preload_condition:
+            while pending_preload is None:
+                preload_condition.wait()
+            zone, tangomon, player_tangomon, music = pending_preload
+            pending_preload = None
+
+        get_arena_sprite(zone)
+        music_manager.prefetch(music)
+        get_tangomon_sprite(tangomon, mirror=True)
+        get_tangomon_sprite(player_tangomon)
+
+
+def get_text_sprite(font, text, width=None, color=None, halign=sge.s.left,
+                    valign=sge.s.top):
+    """
+    Return a sprite with ``text`` drawn on it, with its origin placed
+    according to ``halign`` and ``valign``.  Sprites are cached, so
+    text that does not change is only rendered once.
+    """
+    if color is None:
+        color = sge.gfx.Color("white")
+
+    key = (font, text, width, halign, valign,
+           (color.red, color.green, color.blue, color.alpha))
+    sprite = text_sprite_cache.get(key)
+    if sprite is None:
+        sprite = sge.gfx.Sprite.from_text(font, text, width=width,
+                                          color=color, halign=halign,
+                                          valign=valign)
+        text_sprite_cache.add(key, sprite)
+
+    return sprite
+
+
+def project_cached_text(target, font, text, x, y, z, width=None, color=None,
+                        halign=sge.s.left, valign=sge.s.top):
+    # Like project_text, but drawing the text from the text sprite cache.
+    if text:
+        sprite = get_text_sprite(font, text, width, color, halign, valign)
+        target.project_sprite(sprite, 0, x, y, z)
+
+
+def update_config():
+    # Pass our settings on to the core, which writes them along with
+    # the saves.
+    core.config.update({
+        "first_run": first_run, "font_name": font_name,
+        "fullscreen": fullscreen, "scale_method": scale_method,
+        "sound_enabled": sound_enabled, "music_enabled": music_enabled,
+        "fps_enabled": fps_enabled, "sound_warm_up": sound_warm_up,
+        "sprite_cache_size": sprite_cache_size})
+
+
 def create_fonts():
     # Create the font objects.
     global font
     global font_small
     global font_big
+    global font_version
+
+    if text_sprite_cache is not None:
+        text_sprite_cache.clear()
+    font_version += 1
 
     font = sge.gfx.Font(font_name, size=20)
     font_small = sge.gfx.Font(font_name, size=16)
@@ -1509,112 +1920,33 @@ def create_fonts():
 
 
 def reset_game():
-    global player_zone
-    global player_tangomon
-    global tangomon_encountered
-    player_zone = 0
-    player_tangomon = []
-    tangomon_encountered = {}
-    for i in ZONES:
-        tangomon_encountered[i] = []
+    core.reset_game()
     load_map()
 
 
 def new_game():
-    global player_name
-    global player_zone
-    global player_tangojis
-    global player_tangokans
-    global player_tangomon
-    global player_tangojections
-    global tangomon_encountered
     text = _("What is your name?")
-    player_name = None
-    while not player_name:
-        player_name = xsge_gui.get_text_entry(gui_handler, message=text)
-    player_zone = 0
-    player_tangojis = []
-    player_tangokans = []
-    player_tangomon = []
-    player_tangojections = []
-    tangomon_encountered = {}
-    for i in ZONES:
-        tangomon_encountered[i] = []
+    name = None
+    while not name:
+        name = xsge_gui.get_text_entry(gui_handler, message=text)
+    core.new_game(name)
 
 
 def save_game():
-    global save_slots
-
-    if not NOSAVE:
-        if current_save_slot is not None:
-            save_slots[current_save_slot] = {
-                "version": 1,
-                "player_name": player_name,
-                "player_zone": player_zone, "player_tangojis": player_tangojis,
-                "player_tangokans": player_tangokans,
-                "player_tangomon": player_tangomon,
-                "player_tangojections": player_tangojections,
-                "tangomon_encountered": tangomon_encountered}
-
-        write_to_disk()
-
-
-def load_game():
-    global player_name
-    global player_zone
-    global player_tangojis
-    global player_tangokans
-    global player_tangomon
-    global player_tangojections
-    global tangomon_encountered
-
-    if (current_save_slot is not None and
-            save_slots[current_save_slot] is not None):
-        slot = save_slots[current_save_slot]
-        player_name = slot.get("player_name")
-        player_zone = slot.get("player_zone", 0)
-        player_tangojis = slot.get("player_tangojis", [])
-        player_tangokans = slot.get("player_tangokans", [])
-        player_tangomon = slot.get("player_tangomon", [])
-        player_tangojections = slot.get("player_tangojections", [])
-        tangomon_encountered = slot.get("tangomon_encountered", {})
-        for i in ZONES:
-            tangomon_encountered.setdefault(i, [])
-
-        if slot.get("version", 0) < 1:
-            tjs = list(set([(d["word"], d["clue"]) for d in player_tangojections]))
-            for word, clue in tjs:
-                ilist = []
-                for i in range(len(player_tangojections)):
-                    if (player_tangojections[i]["word"] == word and
-                            player_tangojections[i]["clue"] == clue):
-                        ilist.append(i)
-
-                assert ilist
-                if len(ilist) >= 2:
-                    tj1 = player_tangojections[ilist[0]]
-                    tj2 = player_tangojections[ilist[1]]
-                    tj1["next_time"] = tj2["time"] - tj1["time"]
-                else:
-                    player_tangojections[ilist[0]]["next_time"] = 36 * MONTH
-
-                for i in reversed(ilist[1:]):
-                    del player_tangojections[i]
-    else:
-        return False
-
-    return True
+    update_config()
+    core.save_game()
 
 
 def load_map():
-    if not player_tangomon:
-        zone = ZONES[0]
-        if tangomon_encountered[zone]:
-            player_tangomon.append(tangomon_encountered[zone][0])
-        else:
-            player_tangomon.append(random.choice(list(tangomon_sets[zone])))
+    core.give_starter_tangomon()
+
+    if len(core.player_tangojis) < core.TANGOJI_MIN:
+        text = _("You need at least {minimum} tangojis to start. You can type them in one at a time, or import a list of them from a file.").format(minimum=core.TANGOJI_MIN)
+        buttons = [_("Type Them In"), _("Import a File")]
+        if xsge_gui.show_message(gui_handler, message=text, buttons=buttons):
+            import_player_tangojis()
 
-    while len(player_tangojis) < TANGOJI_MIN:
+    while len(core.player_tangojis) < core.TANGOJI_MIN:
         r = add_player_tangoji()
         if not r:
             text = _("You must add a tangoji to continue.")
@@ -1625,26 +1957,85 @@ def load_map():
 
 
 def write_to_disk():
-    if not NOSAVE:
-        # Write our saves and settings to disk.
-        cfg = {"version": 0, "first_run": first_run, "font_name": font_name,
-               "fullscreen": fullscreen, "scale_method": scale_method,
-               "sound_enabled": sound_enabled, "music_enabled": music_enabled,
-               "fps_enabled": fps_enabled}
+    """Have our saves and settings written to disk by the save thread."""
+    update_config()
+    core.write_to_disk()
+
+
+def get_offline_slot_path(path, i):
+    # Path of the file for the slot at index i in batch offline play.
+    if path == "-":
+        return path
+    root, ext = os.path.splitext(path)
+    return "{}-slot{}{}".format(root, i + 1, ext)
+
+
+def print_offline_notice(text, path):
+    # Keep notices out of the way of a sheet printed to standard output.
+    if path == "-":
+        print(text, file=sys.stderr)
+    else:
+        print(text)
+
 
-        with open(CONFIG_PATH, 'w') as f:
-            json.dump(cfg, f, indent=4)
+def read_offline_results(path):
+    """
+    Read the results of an offline session from the file at ``path``, or
+    from standard input if ``path`` is "-".  Return the time code, the
+    IDs of the failed tests and the IDs of the failed tangokans.
+    ValueError is raised if the file can't be understood; use
+    :func:`core.check_offline_results` to check the results against the
+    game.
+
+    Empty lines and lines starting with "#" are ignored.  Every other
+    line is "time_code", "test" or "tangokan" followed by a number.
+    """
+    if path == "-":
+        f = sys.stdin
+    else:
+        f = open(path, encoding="utf-8")
 
-        if os.path.exists(SAVE_SLOTS_PATH):
-            if os.path.exists(SAVE_SLOTS_BACKUP_PATH):
-                os.remove(SAVE_SLOTS_BACKUP_PATH)
-            shutil.copy(SAVE_SLOTS_PATH, SAVE_SLOTS_BACKUP_PATH)
+    time_code = None
+    failed = {"test": set(), "tangokan": set()}
+    try:
+        for n, line in enumerate(f, 1):
+            words = line.split()
+            if not words or words[0].startswith("#"):
+                continue
 
-        with open(SAVE_SLOTS_PATH, 'w') as f:
-            json.dump(save_slots, f, indent=4)
+            try:
+                kind, value = words
+                value = int(value)
+            except ValueError:
+                raise ValueError(_("line {}: expected a word and a number").format(n))
+
+            if kind == "time_code":
+                if time_code is not None:
+                    raise ValueError(_("line {}: more than one time code").format(n))
+                time_code = value
+            elif kind in failed:
+                failed[kind].add(value)
+            else:
+                raise ValueError(_('line {}: unknown entry "{}"').format(n, kind))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    if time_code is None:
+        raise ValueError(_("no time code given"))
 
-        if os.path.exists(SAVE_SLOTS_BACKUP_PATH):
-            os.remove(SAVE_SLOTS_BACKUP_PATH)
+    return time_code, failed["test"], failed["tangokan"]
+
+
+def get_offline_problem_text(problem):
+    # Text of a problem found by core.check_offline_results().
+    kind, value = problem
+    if kind == "time_code":
+        return _("the time code is in the future")
+    elif kind == "test":
+        return _("there was no test {} at that time code").format(value)
+    else:
+        return _("there was no tangokan {} at that time code").format(value)
 
 
 # Get an integer in the range [x,y] from the user through the terminal.
@@ -1668,209 +2059,254 @@ def input_int(x=None, y=None, can_cancel=False):
             return None
 
 
-if not os.path.exists(CONFIG):
-    os.makedirs(CONFIG)
+cfg = core.load_config()
+cfg_version = cfg.get("version", 0)
+first_run = cfg.get("first_run", True)
+
+font_name = cfg.get("font_name", font_name)
+fullscreen = cfg.get("fullscreen", fullscreen)
+scale_method = cfg.get("scale_method", scale_method)
+sound_enabled = cfg.get("sound_enabled", sound_enabled)
+music_enabled = cfg.get("music_enabled", music_enabled)
+fps_enabled = cfg.get("fps_enabled", fps_enabled)
+sound_warm_up = cfg.get("sound_warm_up", sound_warm_up)
+sprite_cache_size = cfg.get("sprite_cache_size", sprite_cache_size)
+if (not isinstance(sprite_cache_size, (int, float)) or
+        isinstance(sprite_cache_size, bool) or sprite_cache_size <= 0):
+    sprite_cache_size = SPRITE_CACHE_SIZE
+mark_startup_phase("config")
+
+core.load_save_index()
+mark_startup_phase("saves")
+
+
+if __name__ == "__main__" and EXPORT_SLOT is not None:
+    # Export a save slot as JSON
+    i = EXPORT_SLOT[0] - 1
+    if 0 <= i < len(core.save_slots) and core.save_slots[i]:
+        with open(EXPORT_SLOT[1], 'w', encoding="utf-8") as f:
+            json.dump(core.read_save_slot(i), f, indent=4)
+        print(_("Save slot exported to {}.").format(EXPORT_SLOT[1]))
+    else:
+        print(_("There is no game saved in that slot."))
+elif __name__ == "__main__" and IMPORT_SLOT is not None:
+    # Import a save slot from JSON
+    i = IMPORT_SLOT[0] - 1
+    if NOSAVE:
+        print(_("Saving is disabled, so nothing was imported."))
+    elif 0 <= i < len(core.save_slots):
+        with open(IMPORT_SLOT[1], encoding="utf-8") as f:
+            slot = json.load(f)
+        core.loaded_save_slots[i] = slot
+        core.save_slots[i] = core.get_save_summary(slot)
+        core.dirty_save_slots.add(i)
+        write_to_disk()
+        if not core.flush_saves():
+            sys.exit(_("Could not save the game: {}").format(core.save_error))
+        print(_("Save slot imported from {}.").format(IMPORT_SLOT[1]))
+    else:
+        print(_("There is no such save slot."))
+elif __name__ == "__main__" and IMPORT_TANGOJIS is not None:
+    # Import tangojis into a save slot
+    i = IMPORT_TANGOJIS[0] - 1
+    if 0 <= i < len(core.save_slots) and core.save_slots[i]:
+        core.current_save_slot = i
+        core.load_game()
+        try:
+            text = import_tangojis_file(IMPORT_TANGOJIS[1])
+        except (OSError, ValueError) as e:
+            sys.exit(_("Could not import the tangojis: {}").format(e))
+
+        save_game()
+        if not core.flush_saves():
+            sys.exit(_("Could not save the game: {}").format(core.save_error))
+        print(text)
+    else:
+        print(_("There is no game saved in that slot."))
+elif __name__ == "__main__" and FORECAST is not None:
+    # Forecast the tests that will fall due
+    i = FORECAST[0] - 1
+    if 0 <= i < len(core.save_slots) and core.save_slots[i]:
+        core.current_save_slot = i
+        core.load_game()
+        days = FORECAST[1] * core.MONTH // core.DAY
+        counts = core.forecast_reviews(days)
+        today = datetime.date.today()
+        for day in range(len(counts)):
+            date = today + datetime.timedelta(days=day)
+            print("{}: {}".format(date.isoformat(), counts[day]))
+
+        if counts:
+            peak = counts.index(max(counts))
+            date = today + datetime.timedelta(days=peak)
+            print(_("Busiest day: {date} ({tests} tests)").format(
+                date=date.isoformat(), tests=counts[peak]))
+    else:
+        print(_("There is no game saved in that slot."))
+elif __name__ == "__main__" and OFFLINE_SLOTS is not None:
+    # Batch offline play
+    if OFFLINE_SLOTS.strip().lower() == "all":
+        slots = [i for i in range(len(core.save_slots))
+                 if core.save_slots[i]]
+    else:
+        try:
+            slots = [int(i) - 1 for i in OFFLINE_SLOTS.split(",")]
+        except ValueError:
+            sys.exit(_("Invalid entry: must be an integer."))
+        for i in slots:
+            if not (0 <= i < len(core.save_slots) and core.save_slots[i]):
+                sys.exit(_("There is no game saved in slot {}.").format(i + 1))
+
+    if OFFLINE_RESULTS and not OFFLINE_RESULTS_FILE:
+        sys.exit(_('Results for several slots must be read with the "--results-file" option.'))
+    if OFFLINE_JOBS > 1 and "-" in (OFFLINE_OUTPUT, OFFLINE_ANSWERS,
+                                    OFFLINE_RESULTS_FILE):
+        sys.exit(_('"-" can only be used with one job.'))
+    if OFFLINE_RESULTS_FILE == "-" and len(slots) > 1:
+        sys.exit(_('Results for several slots can\'t be read from standard input.'))
+
+    time_code = int(time.time())
+    jobs = []
+    for i in slots:
+        job = {"slot": i}
+        if OFFLINE_RESULTS_FILE:
+            path = get_offline_slot_path(OFFLINE_RESULTS_FILE, i)
+            try:
+                job["results"] = read_offline_results(path)
+            except (OSError, ValueError) as e:
+                print(_("Slot {}: could not read the results: {}").format(
+                    i + 1, e))
+                continue
+        else:
+            job.update({
+                "time_code": time_code,
+                "output": get_offline_slot_path(OFFLINE_OUTPUT, i),
+                "answers": get_offline_slot_path(OFFLINE_ANSWERS, i),
+                "template": OFFLINE_TEMPLATE,
+                "answers_template": OFFLINE_ANSWERS_TEMPLATE,
+                "info_template": OFFLINE_INFO_TEMPLATE})
+        jobs.append(job)
+
+    start = time.perf_counter()
+    summaries = core.run_offline_jobs(jobs, OFFLINE_JOBS)
+    elapsed = time.perf_counter() - start
+
+    for job, summary in zip(jobs, summaries):
+        slot = summary["slot"] + 1
+        if summary.get("error") == "save":
+            text = _("Slot {slot} ({name}): could not save the game: {error}").format(
+                slot=slot, name=summary["name"], error=summary["save_error"])
+        elif "error" in summary:
+            text = _("Slot {}: could not load the game.").format(slot)
+        elif "results" not in job:
+            counts = summary["counts"]
+            text = _("Slot {slot} ({name}): {tests} tests, {tangojis} tangojis and {tangokans} tangokans written to {path}.").format(
+                slot=slot, name=summary["name"],
+                tests=counts.get("tangojections", 0),
+                tangojis=counts.get("tangojis", 0),
+                tangokans=counts.get("tangokans", 0), path=summary["output"])
+        elif summary["problems"]:
+            text = _("Slot {slot} ({name}): could not read the results: {error}").format(
+                slot=slot, name=summary["name"],
+                error=get_offline_problem_text(summary["problems"][0]))
+        else:
+            text = _("Slot {slot} ({name}): results stored ({failed} of {tests} tests and {failed_tangokans} tangokans failed).").format(
+                slot=slot, name=summary["name"],
+                failed=summary["failed_tests"], tests=summary["tests"],
+                failed_tangokans=summary["failed_tangokans"])
+        print_offline_notice(text, OFFLINE_OUTPUT)
+
+    print_offline_notice(
+        _("{} slots processed in {:.2f} seconds.").format(len(summaries),
+                                                          elapsed),
+        OFFLINE_OUTPUT)
+
+    if OFFLINE_SUMMARY:
+        with open(OFFLINE_SUMMARY, 'w', encoding="utf-8") as f:
+            json.dump(summaries, f, indent=4)
+
+    if not core.flush_saves():
+        sys.exit(_("Could not save the game: {}").format(core.save_error))
+elif __name__ == "__main__" and OFFLINE_SLOT is not None:
+    # Offline play
+    if (1 <= OFFLINE_SLOT <= len(core.save_slots) and
+            core.save_slots[OFFLINE_SLOT - 1]):
+        core.current_save_slot = OFFLINE_SLOT - 1
+        core.load_game()
 
-if os.path.exists(SAVE_SLOTS_BACKUP_PATH):
-    if os.path.exists(SAVE_SLOTS_PATH):
-        os.remove(SAVE_SLOTS_PATH)
-    os.rename(SAVE_SLOTS_BACKUP_PATH, SAVE_SLOTS_PATH)
+        if OFFLINE_RESULTS_FILE:
+            try:
+                results = read_offline_results(OFFLINE_RESULTS_FILE)
+            except (OSError, ValueError) as e:
+                sys.exit(_("Could not read the results: {}").format(e))
 
-try:
-    with open(SAVE_SLOTS_PATH) as f:
-        loaded_slots = json.load(f)
-except (OSError, ValueError):
-    pass
-else:
-    for i in range(min(len(loaded_slots), len(save_slots))):
-        save_slots[i] = loaded_slots[i]
+            problems = core.check_offline_results(*results)
+            if problems:
+                sys.exit(_("Could not read the results: {}").format(
+                    get_offline_problem_text(problems[0])))
 
-try:
-    with open(CONFIG_PATH) as f:
-        cfg = json.load(f)
-except (OSError, ValueError):
-    cfg = {}
-finally:
-    cfg_version = cfg.get("version", 0)
-    first_run = cfg.get("first_run", True)
-
-    font_name = cfg.get("font_name", font_name)
-    fullscreen = cfg.get("fullscreen", fullscreen)
-    scale_method = cfg.get("scale_method", scale_method)
-    sound_enabled = cfg.get("sound_enabled", sound_enabled)
-    music_enabled = cfg.get("music_enabled", music_enabled)
-    fps_enabled = cfg.get("fps_enabled", fps_enabled)
-
-
-if __name__ == "__main__" and OFFLINE_SLOT is not None:
-    # Offline play
-    if 1 <= OFFLINE_SLOT <= len(save_slots) and save_slots[OFFLINE_SLOT - 1]:
-        current_save_slot = OFFLINE_SLOT - 1
-        load_game()
-        player_tangojections.sort(key=lambda d: d.get("time"))
-
-        if OFFLINE_RESULTS:
+            core.apply_offline_results(*results)
+            save_game()
+            if not core.flush_saves():
+                sys.exit(_("Could not save the game: {}").format(core.save_error))
+            print(_("Offline session results stored. Thank you."))
+        elif OFFLINE_RESULTS:
             print("Please enter the time code for your offline session.")
             time_code = input_int()
 
             print(_("Enter the ID number for each of your FAILED tests. When finished, leave blank and press Enter."))
-            failed = []
+            failed_tests = []
             while True:
-                i = input_int(0, len(player_tangojections) - 1, True)
+                i = input_int(0, len(core.player_tangojections) - 1, True)
                 if i is not None:
-                    failed.append(i)
+                    failed_tests.append(i)
                 else:
                     break
 
-            tangojections = []
-            while (player_tangojections and
-                   player_tangojections[0].get("time", time_code) <= time_code):
-                tangojections.append(player_tangojections.pop(0))
-
-            failed.sort(reverse=True)
-            for i in failed:
-                tangoji = tangojections.pop(i)
-                tangoji["power"] = TANGOJI_MULT_START
-                player_tangojis.append(tangoji)
-
-            for tangoji in tangojections:
-                nt = tangoji.setdefault("next_time", DAY)
-                dev = random.uniform(-nt / 10, nt / 10)
-                tangoji["time"] = time_code + nt + dev
-                tangoji["next_time"] *= 2
-                player_tangojections.append(tangoji)
-
-            player_tangojections.sort(key=lambda d: d.get("time"))
-
             print(_("Enter the ID number for each of your FAILED tangokans. When finished, leave blank and press Enter."))
-            failed = []
+            failed_tangokans = []
             while True:
-                i = input_int(0, len(player_tangokans), True)
+                i = input_int(0, len(core.player_tangokans), True)
                 if i is not None:
-                    failed.append(i)
+                    failed_tangokans.append(i)
                 else:
                     break
 
-            failed.sort(reverse=True)
-            for i in failed:
-                tangoji = player_tangokans.pop(i)
-                tangoji["power"] = TANGOJI_MULT_START
-                player_tangojis.append(tangoji)
-
-            active_tangokans = []
-            for i in range(len(player_tangokans)):
-                tangokan = player_tangokans[i]
-                tangokan.setdefault("active_time", time_code + TANGOKAN_WAIT_TIME)
-                if time_code >= tangokan["active_time"]:
-                    active_tangokans.append(i)
-
-            for i in sorted(active_tangokans, reverse=True):
-                tangoji = player_tangokans.pop(i)
-                wait = DAY
-                tangoji["time"] = time_code + wait
-                tangoji["next_time"] = wait * 2
-                player_tangojections.append(tangoji)
+            core.apply_offline_results(time_code, failed_tests,
+                                       failed_tangokans)
 
             save_game()
+            if not core.flush_saves():
+                sys.exit(_("Could not save the game: {}").format(core.save_error))
             print(_("Offline session results stored. Thank you."))
         else:
-            template = _("TANGOMON OFFLINE ({name})\n\nTime code: {time_code}\n\nTests:\n{tangojections}\n\nTangojis:\n{tangojis}\n\nTangokans:\n{tangokans}")
-            ans_template = _("TANGOMON OFFLINE ANSWERS ({name})\n\nTime code: {time_code}\n\nTests:\n{tangojections}\n\nTangojis:\n{tangojis}\n\nTangokans:\n{tangokans}")
-            list_template = "* {}: {}"
-            tangoji_info_template = _("{tangoji} ({info})")
             time_code = int(time.time())
 
-            tangojections = []
-            tangojections_ans = []
-            for i in range(len(player_tangojections)):
-                if player_tangojections[i].get("time", time_code) <= time_code:
-                    tangoji = player_tangojections[i]
-                    tangojections.append(list_template.format(
-                        i, tangoji["clue"]))
-
-                    if tangoji.setdefault("info"):
-                        tangojections_ans.append(list_template.format(
-                            i, tangoji_info_template.format(
-                                tangoji=tangoji["word"],
-                                info=tangoji["info"])))
-                    else:
-                        tangojections_ans.append(list_template.format(
-                            i, tangoji["word"]))
-                else:
-                    break
-
-            tangojis = []
-            tangojis_ans = []
-            for i in range(len(player_tangojis)):
-                tangoji = player_tangojis[i]
-                tangojis.append(
-                    list_template.format(i, tangoji["clue"]))
-
-                if tangoji.setdefault("info"):
-                    tangojis_ans.append(list_template.format(
-                        i, tangoji_info_template.format(
-                            tangoji=tangoji["word"], info=tangoji["info"])))
-                else:
-                    tangojis_ans.append(list_template.format(
-                        i, tangoji["word"]))
-
-
-            tangokans = []
-            tangokans_ans = []
-            for i in range(len(player_tangokans)):
-                tangokan = player_tangokans[i]
-                tangokan.setdefault("active_time",
-                                    time_code + TANGOKAN_WAIT_TIME)
-                if time_code >= tangokan["active_time"]:
-                    tangokans.append(
-                        list_template.format(i, player_tangokans[i]["clue"]))
-
-                    if tangokan.setdefault("info"):
-                        tangokans_ans.append(list_template.format(
-                            i, tangoji_info_template.format(
-                                tangoji=tangokan["word"],
-                                info=tangokan["info"])))
-                    else:
-                        tangokans_ans.append(list_template.format(
-                            i, tangokan["word"]))
-
-            stangojections = "\n".join(tangojections)
-            stangojis = "\n".join(tangojis)
-            stangokans = "\n".join(tangokans)
-
-            s = template.format(
-                name=player_name, time_code=time_code,
-                tangojections=stangojections, tangojis=stangojis,
-                tangokans=stangokans)
-
-            with open("tangomon-offline.txt", 'w', encoding="utf-8") as f:
-                f.write(s)
-
-            print(_("Offline session written to tangomon-offline.txt."))
-
-            stangojections = "\n".join(tangojections_ans)
-            stangojis = "\n".join(tangojis_ans)
-            stangokans = "\n".join(tangokans_ans)
-
-            s = ans_template.format(
-                name=player_name, time_code=time_code,
-                tangojections=stangojections, tangojis=stangojis,
-                tangokans=stangokans)
-
-            with open("tangomon-offline-answers.txt", 'w', encoding="utf-8") as f:
-                f.write(s)
-
-            print(_("Answer key written to tangomon-offline-answers.txt."))
+            core.write_offline_session(OFFLINE_OUTPUT, OFFLINE_TEMPLATE,
+                                       time_code,
+                                       info_template=OFFLINE_INFO_TEMPLATE)
+            print_offline_notice(
+                _("Offline session written to {}.").format(OFFLINE_OUTPUT),
+                OFFLINE_OUTPUT)
+
+            core.write_offline_session(OFFLINE_ANSWERS,
+                                       OFFLINE_ANSWERS_TEMPLATE, time_code,
+                                       answers=True,
+                                       info_template=OFFLINE_INFO_TEMPLATE)
+            print_offline_notice(
+                _("Answer key written to {}.").format(OFFLINE_ANSWERS),
+                OFFLINE_ANSWERS)
 else:
     # Regular play
     print(_("Initializing game system..."))
-    Game(SCREEN_SIZE[0], SCREEN_SIZE[1], fps=FPS, delta=DELTA,
+    Game(SCREEN_SIZE[0], SCREEN_SIZE[1], fps=core.FPS, delta=DELTA,
          delta_min=DELTA_MIN, delta_max=DELTA_MAX,
          window_text="Tangomon {}".format(__version__),
          window_icon=os.path.join(DATA, "images", "misc", "icon.png"))
 
     sge.keyboard.set_repeat(interval=KEY_REPEAT_INTERVAL,
                             delay=KEY_REPEAT_DELAY)
+    mark_startup_phase("game")
 
     print(_("Initializing GUI system..."))
     xsge_gui.init()
@@ -1882,48 +2318,34 @@ else:
     gui_handler = xsge_gui.Handler()
 
     menu_color = sge.gfx.Color("black")
+    mark_startup_phase("gui")
 
     print(_("Loading media..."))
 
     # Load sprites
     d = os.path.join(DATA, "images", "misc")
     logo_sprite = sge.gfx.Sprite("logo", d, origin_x=300)
+    mark_startup_phase("sprites")
 
     # Find tangomon
-    for zone in ZONES:
-        tangomon_sets[zone] = set()
-        d = os.path.join(DATA, "images", "tangomon", zone)
-        for fname in os.listdir(d):
-            root, ext = os.path.splitext(fname)
-            try:
-                sprite = sge.gfx.Sprite(root, d)
-            except OSError:
-                pass
-            else:
-                tangomon_sets[zone].add(root)
+    core.find_tangomon()
+    core.index_tangomon()
+    tangomon_sprite_cache = SpriteCache(sprite_cache_size * 1024 * 1024)
+    text_sprite_cache = SpriteCache(TEXT_CACHE_SIZE * 1024 * 1024)
+    mark_startup_phase("tangomon")
 
     # Create fonts
     create_fonts()
+    mark_startup_phase("fonts")
 
-    # Load sounds
-    charge_sound = sge.snd.Sound(os.path.join(DATA, "sounds", "charge.wav"))
-    hurt_sound = sge.snd.Sound(os.path.join(DATA, "sounds", "hurt.wav"))
-    block_sound = sge.snd.Sound(os.path.join(DATA, "sounds", "block.wav"))
-    critical_sound = sge.snd.Sound(os.path.join(
-        DATA, "sounds", "critical.wav"))
-    engage_tangokan_sound = sge.snd.Sound(os.path.join(
-        DATA, "sounds", "engage_tangokan.wav"), volume=0.8)
-    start_tangoject_sound = sge.snd.Sound(os.path.join(
-        DATA, "sounds", "start_tangoject.wav"))
-    pass_test_sound = sge.snd.Sound(os.path.join(
-        DATA, "sounds", "pass_test.wav"))
-    fail_test_sound = sge.snd.Sound(os.path.join(
-        DATA, "sounds", "fail_test.wav"))
-
-    select_sound = sge.snd.Sound(os.path.join(DATA, "sounds", "select.ogg"))
-    confirm_sound = sge.snd.Sound(os.path.join(DATA, "sounds", "confirm.wav"))
-    cancel_sound = sge.snd.Sound(os.path.join(DATA, "sounds", "cancel.wav"))
-    type_sound = sge.snd.Sound(os.path.join(DATA, "sounds", "type.wav"))
+    # Register sounds
+    sound_bank = SoundBank(os.path.join(DATA, "sounds"), SOUND_VOLUMES)
+    if sound_enabled and sound_warm_up:
+        sound_bank.start_warm_up()
+    mark_startup_phase("sounds")
+
+    music_manager = MusicManager(os.path.join(DATA, "music"),
+                                 MUSIC_CACHE_SIZE * 1024 * 1024)
 
     # Create rooms
     sge.game.start_room = TitleScreen()
@@ -1931,6 +2353,10 @@ else:
     # Settings
     sge.game.fullscreen = fullscreen
     sge.game.scale_method = scale_method
+    mark_startup_phase("rooms")
+
+    if PROFILE_STARTUP:
+        write_startup_profile(PROFILE_STARTUP, PROFILE_STARTUP_CPROFILE)
 
     if __name__ == "__main__":
         print(_("Starting game..."))
@@ -1938,4 +2364,6 @@ else:
             sge.game.start()
         finally:
             save_game()
+            if not core.flush_saves():
+                print(_("Could not save the game: {}").format(core.save_error))
 
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of the save formats of Tangomon.
+
+A save slot with a made-up deck of the given size is encoded and
+decoded in each format with the functions the game uses (in
+:mod:`tangomon_core`), and the size of the result and the best time
+of several tries are reported.  Only encoding and decoding are timed,
+not writing to the disk.
+"""
+
+import argparse
+import json
+import random
+import time
+
+import tangomon_core as core
+
+
+TANGOJIS = 50000
+TANGOJECTIONS = 50000
+TANGOKANS = 200
+REPEAT = 3
+
+
+def make_slot(tangojis, tangojections, tangokans, seed=0):
+    # A save slot as save_game() would make it, with made-up tangojis.
+    rng = random.Random(seed)
+    now = time.time()
+    next_id = iter(range(1, tangojis + tangojections + tangokans + 1))
+
+    def make_tangoji(i):
+        word = "word{}".format(i)
+        return {"word": word, "clue": "clue for {}".format(word),
+                "info": "" if i % 3 else "info {}".format(i),
+                "power": rng.choice([0.25, 0.5, 0.75, 1.0]),
+                "id": next(next_id)}
+
+    deck = [make_tangoji(i) for i in range(tangojis)]
+    reviews = []
+    for i in range(tangojections):
+        tangoji = make_tangoji(tangojis + i)
+        tangoji["time"] = now + rng.uniform(-core.MONTH, core.MONTH)
+        tangoji["next_time"] = core.DAY * 2 ** rng.randrange(10)
+        reviews.append(tangoji)
+    kans = []
+    for i in range(tangokans):
+        tangoji = make_tangoji(tangojis + tangojections + i)
+        tangoji["active_time"] = now + rng.uniform(0, core.TANGOKAN_WAIT_TIME)
+        kans.append(tangoji)
+
+    return {"version": 1, "player_name": "Benchmark", "player_zone": 0,
+            "player_tangojis": deck, "player_tangokans": kans,
+            "player_tangomon": ["tangomon"] * 20,
+            "player_tangojections": reviews,
+            "tangomon_encountered": {zone: [] for zone in core.ZONES}}
+
+
+def benchmark(slot, fmt, repeat=REPEAT):
+    """
+    Return the size of ``slot`` encoded in the format ``fmt``, and the
+    best times taken to encode and decode it, in seconds.
+    """
+    encode_time = None
+    decode_time = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        data = core.encode_save_slot(slot, fmt)
+        elapsed = time.perf_counter() - start
+        if encode_time is None or elapsed < encode_time:
+            encode_time = elapsed
+
+        start = time.perf_counter()
+        decoded = core.decode_save_slot(data)
+        elapsed = time.perf_counter() - start
+        if decode_time is None or elapsed < decode_time:
+            decode_time = elapsed
+
+    if decoded != slot:
+        raise AssertionError("{} did not decode to the same slot".format(fmt))
+
+    return len(data), encode_time, decode_time
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="tangomon_bench",
+        description="Compare the size and speed of the save formats.")
+    parser.add_argument(
+        "-n", "--tangojis", type=int, default=TANGOJIS,
+        help="Number of tangojis in the slot (Default: {}).".format(
+            TANGOJIS))
+    parser.add_argument(
+        "--tangojections", type=int, default=TANGOJECTIONS,
+        help="Number of tangojections in the slot (Default: {}).".format(
+            TANGOJECTIONS))
+    parser.add_argument(
+        "--tangokans", type=int, default=TANGOKANS,
+        help="Number of tangokans in the slot (Default: {}).".format(
+            TANGOKANS))
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=REPEAT,
+        help="Tries of each format; the best is reported "
+             "(Default: {}).".format(REPEAT))
+    parser.add_argument(
+        "--json", action="store_true",
+        help="Output the results as JSON instead of a table.")
+    args = parser.parse_args()
+
+    slot = make_slot(args.tangojis, args.tangojections, args.tangokans)
+    reports = []
+    for fmt in sorted(core.SAVE_FORMATS):
+        size, encode_time, decode_time = benchmark(slot, fmt, args.repeat)
+        reports.append({"format": fmt, "size": size,
+                        "save_time": encode_time, "load_time": decode_time})
+
+    if args.json:
+        print(json.dumps(reports, indent=4))
+    else:
+        print("{:<8} {:>10} {:>10} {:>10}".format("Format", "Size (MB)",
+                                                  "Save (s)", "Load (s)"))
+        for r in reports:
+            print("{:<8} {:>10.1f} {:>10.2f} {:>10.2f}".format(
+                r["format"], r["size"] / 1024 / 1024, r["save_time"],
+                r["load_time"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2199 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The Tangomon game state, rules and save files.
+
+This module does not depend on sge, so it can be used by batch jobs
+and tests that have no display.  Importing it has no side effects;
+call :func:`set_config_dir`, :func:`load_config` and
+:func:`load_save_index` to get at the player's saves.
+"""
+
+import array
+import bisect
+import collections
+import concurrent.futures
+import csv
+import heapq
+import html
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import string
+import struct
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+CONFIG = os.path.join(
+    os.getenv("XDG_CONFIG_HOME", os.path.join(os.path.expanduser("~"),
+                                              ".config")), "tangomon")
+NOSAVE = False
+
+CONFIG_PATH = None
+SAVE_SLOTS_PATH = None
+SAVE_SLOTS_BACKUP_PATH = None
+SAVE_JOURNAL_PATH = None
+SAVE_JOURNAL_OLD_PATH = None
+SAVE_DIR = None
+SAVE_INDEX_PATH = None
+
+SAVE_NSLOTS = 5
+SAVE_JOURNAL_COMPACT_SIZE = 1024 * 1024
+SAVE_BACKUPS = 1
+SAVE_FORMATS = {"json": ".json", "binary": ".bin"}
+SAVE_BINARY_MAGIC = b"TANGOMON-SAVE\x00\x01"
+# Lists whose order is not kept in the journal, since the game doesn't
+# depend on it.
+SAVE_UNORDERED_KEYS = {"player_tangojections"}
+OFFLINE_BUFFER_SIZE = 64 * 1024
+
+TANGOJI_MIN = 3
+TANGOJI_FIELDS = ("word", "clue", "info", "power", "time", "next_time",
+                  "active_time", "id")
+TANGOJI_INTERNED_FIELDS = {"word", "clue", "info"}
+# Separators named by the "#separator:" header of Anki text exports.
+TANGOJI_IMPORT_SEPARATORS = {"tab": "\t", "comma": ",", "semicolon": ";",
+                             "pipe": "|", "space": " ", "colon": ":"}
+
+IMAGE_EXTENSIONS = {".png", ".gif", ".bmp", ".jpg", ".jpeg", ".tga"}
+
+ZONES = [
+    "grassland", "camp_green", "oceanic_abyss", "dark_forest", "haunted_castle",
+    "oasial_crypt", "mountains_of_malevolence", "death_valley",
+    "doom_dungeon"]
+
+HEALTH_MAX_START = 500
+BASE_POWER_START = 75
+HEALTH_INCREMENT_FACTOR = 1.025
+BASE_POWER_INCREMENT_FACTOR = 1.025
+ZONE_BUFFER = 3
+
+# Battles are timed in frames.
+FPS = 60
+BATTLE_START_WAIT = 2 * FPS
+TEST_WAIT = FPS / 2
+TEST_LIMIT = 5
+ATTACK_INTERVAL_TIME = 4 * FPS
+ATTACK_INTERVAL_FAIL_TIME = 8 * FPS
+TANGOJI_ENTRY_TIME = 10 * FPS
+TANGOJI_MULT_START = 1.0
+TANGOJI_MULT_DECREMENT = 0.025
+TANGOJI_MULT_MIN = 0.25
+TANGOJI_MULT_PERSISTENT_MIN = 0.5
+TANGOJI_MULT_BULK_BONUS = 0.005
+TANGOJI_MULT_TIME_BONUS = 0.5 / TANGOJI_ENTRY_TIME
+CRITICAL_CHANCE = 0.02
+CRITICAL_MULT = 2
+ENEMY_NERF = 0.5
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+MONTH = 30 * DAY
+TANGOKAN_WAIT_TIME = 12 * HOUR
+
+config = {}
+save_backups = SAVE_BACKUPS
+save_format = "json"
+save_slots = [None for i in range(SAVE_NSLOTS)]
+loaded_save_slots = {}
+save_journal_cache = {}
+save_index_text = None
+dirty_save_slots = set()
+save_compaction = True
+save_compact_threads = {}
+save_thread = None
+save_condition = threading.Condition()
+pending_save = None
+failed_save = None
+save_error = None
+save_busy = False
+
+tangomon_sets = {}
+tangomon_catalog = {}
+tangomon_index = {}
+
+current_save_slot = None
+
+player_name = None
+player_zone = 0
+player_tangojis = []
+player_tangokans = []
+player_tangomon = []
+player_tangojections = []
+tangomon_encountered = {}
+tangomon_encountered_index = {}
+roster_hp = None
+roster_power = None
+roster_version = 0
+tangoji_index = None
+next_tangoji_id = 1
+
+
+class Tangoji(object):
+
+    """
+    A tangoji, which is also what tangokans and tangojections are made
+    of.
+
+    Tangojis are saved as dictionaries, and this class can be used like
+    one (``tangoji["word"]``, :meth:`get`, :meth:`setdefault` and so
+    on), but keeps the fields in ``TANGOJI_FIELDS`` in slots, with None
+    meaning that a field is not set.  The strings in those fields are
+    interned, so tangojis with the same word or clue share it.  Any
+    other fields are kept in a dictionary of their own.
+
+    Every tangoji of a save has an ``"id"`` of its own, which the save
+    journal knows it by.  :meth:`get_saved` remembers what the tangoji
+    was last saved as until it is changed, so that saving unchanged
+    tangojis costs nothing.  Fields must be changed with ``tangoji[key]
+    = value`` for this to notice them.
+    """
+
+    __slots__ = TANGOJI_FIELDS + ("extra", "saved")
+
+    def __init__(self, data=(), **kwargs):
+        self.word = None
+        self.clue = None
+        self.info = None
+        self.power = None
+        self.time = None
+        self.next_time = None
+        self.active_time = None
+        self.id = None
+        self.extra = None
+        self.saved = None
+        self.update(data)
+        self.update(kwargs)
+
+    def __repr__(self):
+        return "Tangoji({!r})".format(self.to_dict())
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.saved = None
+        if key in TANGOJI_FIELDS:
+            if key in TANGOJI_INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, key, value)
+        elif value is not None:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        elif self.extra is not None:
+            self.extra.pop(key, None)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self[key] = None
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default=None):
+        if key in TANGOJI_FIELDS:
+            value = getattr(self, key)
+        elif self.extra is not None:
+            value = self.extra.get(key)
+        else:
+            value = None
+
+        return default if value is None else value
+
+    def setdefault(self, key, default=None):
+        value = self.get(key)
+        if value is None:
+            self[key] = default
+            value = default
+        return value
+
+    def keys(self):
+        keys = [key for key in TANGOJI_FIELDS
+                if getattr(self, key) is not None]
+        if self.extra is not None:
+            keys.extend(self.extra)
+        return keys
+
+    def items(self):
+        return [(key, self.get(key)) for key in self.keys()]
+
+    def update(self, data):
+        if hasattr(data, "items"):
+            data = data.items()
+        for key, value in data:
+            self[key] = value
+
+    def copy(self):
+        tangoji = Tangoji()
+        for key in TANGOJI_FIELDS:
+            setattr(tangoji, key, getattr(self, key))
+        if self.extra is not None:
+            tangoji.extra = self.extra.copy()
+        return tangoji
+
+    def to_dict(self):
+        """Return the tangoji as the dictionary it is saved as."""
+        return dict(self.items())
+
+    def get_saved(self):
+        # Return to_dict(), reusing the last one if nothing has changed
+        # since.  The dictionary returned must not be changed.
+        if self.saved is None:
+            self.saved = self.to_dict()
+        return self.saved
+
+
+class RosterStats(object):
+
+    """
+    One stat of the distinct tangomon on the player's team.
+
+    The values are kept sorted with suffix sums, so the average of the
+    peers at or above a given value is found by bisection.  The team is
+    read from ``player_tangomon`` the first time it is needed after
+    :meth:`invalidate`; after that, :meth:`add` and :meth:`remove` keep
+    it up to date.
+    """
+
+    def __init__(self, stat):
+        self.stat = stat
+        self.counts = None
+        self.values = None
+        self.sums = None
+
+    def invalidate(self):
+        self.counts = None
+        self.values = None
+        self.sums = None
+
+    def update(self):
+        if self.counts is None:
+            self.counts = collections.Counter(player_tangomon)
+            self.values = sorted(self.stat(t) for t in self.counts)
+            self.sums = None
+
+        if self.sums is None:
+            self.sums = [0] * (len(self.values) + 1)
+            for i in reversed(range(len(self.values))):
+                self.sums[i] = self.sums[i + 1] + self.values[i]
+
+    def add(self, tangomon):
+        if self.counts is not None:
+            self.counts[tangomon] += 1
+            if self.counts[tangomon] == 1:
+                bisect.insort(self.values, self.stat(tangomon))
+                self.sums = None
+
+    def remove(self, tangomon):
+        if self.counts is not None and self.counts[tangomon] > 0:
+            self.counts[tangomon] -= 1
+            if not self.counts[tangomon]:
+                del self.counts[tangomon]
+                value = self.stat(tangomon)
+                i = bisect.bisect_left(self.values, value)
+                if i < len(self.values) and self.values[i] == value:
+                    del self.values[i]
+                else:
+                    self.invalidate()
+                self.sums = None
+
+    def get_peer_average(self, value):
+        # Average of the values at or above value, or None if there are
+        # no such values.
+        self.update()
+        i = bisect.bisect_left(self.values, value)
+        n = len(self.values) - i
+        if n:
+            return self.sums[i] / n
+        return None
+
+
+class TangojiIndex(object):
+
+    """
+    The player's tangojis, tangokans and tangojections, looked up by
+    word and clue.
+
+    Tangojis are filed under :func:`get_tangoji_key`, so the same word
+    and clue in a different case or with extra space count as the same.
+    The collections are read the first time the index is needed after
+    :meth:`invalidate`; after that, :meth:`add` and :meth:`remove` keep
+    it up to date.  Moving a tangoji from one collection to another
+    doesn't change it.
+    """
+
+    def __init__(self):
+        self.entries = None
+        self.texts = None
+
+    def invalidate(self):
+        self.entries = None
+        self.texts = None
+
+    def update(self):
+        if self.entries is None:
+            self.entries = {}
+            self.texts = {}
+            for tangoji in itertools.chain(player_tangojis, player_tangokans,
+                                           player_tangojections.values()):
+                self.add(tangoji)
+
+    def add(self, tangoji):
+        if self.entries is not None:
+            key = get_tangoji_key(tangoji.get("word") or "",
+                                  tangoji.get("clue") or "")
+            if key not in self.entries:
+                self.entries[key] = []
+                for text in key:
+                    self.texts.setdefault(text, set()).add(key)
+            self.entries[key].append(tangoji)
+
+    def remove(self, tangoji):
+        if self.entries is not None:
+            key = get_tangoji_key(tangoji.get("word") or "",
+                                  tangoji.get("clue") or "")
+            entries = self.entries.get(key, [])
+            for i in range(len(entries)):
+                if entries[i] is tangoji:
+                    del entries[i]
+                    break
+            else:
+                # It was changed since it was added.
+                self.invalidate()
+                return
+
+            if not entries:
+                del self.entries[key]
+                for text in key:
+                    keys = self.texts.get(text)
+                    if keys is not None:
+                        keys.discard(key)
+                        if not keys:
+                            del self.texts[text]
+
+    def find(self, word, clue):
+        # Return a list of the tangojis with this word and clue.
+        self.update()
+        return list(self.entries.get(get_tangoji_key(word, clue), ()))
+
+    def search(self, text):
+        # Return a list of the tangojis whose word or clue is text.
+        self.update()
+        text = text.lower().strip()
+        results = []
+        for key in sorted(self.texts.get(text, ())):
+            results.extend(self.entries[key])
+        return results
+
+
+class ReviewQueue(object):
+
+    """
+    Tangojections ordered by the time their next test is due.
+
+    Tangojections without a time are due immediately.  Iterating over
+    the queue (and :meth:`to_list`) goes from the soonest test to the
+    latest.
+    """
+
+    def __init__(self, tangojections=()):
+        self.counter = itertools.count()
+        self.heap = [(tangoji.get("time", 0), next(self.counter), tangoji)
+                     for tangoji in tangojections]
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def push(self, tangoji):
+        heapq.heappush(self.heap, (tangoji.get("time", 0), next(self.counter),
+                                   tangoji))
+
+    def peek_due(self, now=None):
+        # Return the soonest tangojection if it is due by now, or None.
+        if now is None:
+            now = time.time()
+        if self.heap and self.heap[0][0] <= now:
+            return self.heap[0][2]
+        return None
+
+    def pop_due(self, now=None):
+        # Remove and return the soonest tangojection if it is due by
+        # now, or return None.
+        if self.peek_due(now) is not None:
+            return heapq.heappop(self.heap)[2]
+        return None
+
+    def iter_due(self, now=None):
+        """
+        Iterate over the tangojections that are due by ``now``, from the
+        soonest, without sorting the rest of the queue.  The queue must
+        not be changed while this is going on.
+        """
+        if now is None:
+            now = time.time()
+
+        # Walk the heap from the root, always going on with the soonest
+        # entry whose parent has been reached already.
+        heap = self.heap
+        candidates = [(heap[0], 0)] if heap else []
+        while candidates:
+            entry, i = heapq.heappop(candidates)
+            if entry[0] > now:
+                break
+
+            yield entry[2]
+            for j in (2 * i + 1, 2 * i + 2):
+                if j < len(heap):
+                    heapq.heappush(candidates, (heap[j], j))
+
+    def to_list(self):
+        return [entry[2] for entry in sorted(self.heap)]
+
+    def values(self):
+        # The tangojections in no particular order, without sorting.
+        return [entry[2] for entry in self.heap]
+
+
+def get_tangomon_name(tangomon):
+    return tangomon.replace("_", " ").title()
+
+
+def get_all_tangomon():
+    return set(tangomon_index)
+
+
+def get_player_unique_tangomon():
+    return list(set(player_tangomon))
+
+
+def get_player_active_tangokans(now=None):
+    if now is None:
+        now = time.time()
+
+    active_tangokans = []
+    for i in range(len(player_tangokans)):
+        tangokan = player_tangokans[i]
+        if tangokan.active_time is None:
+            tangokan["active_time"] = now + TANGOKAN_WAIT_TIME
+        if now >= tangokan.active_time:
+            active_tangokans.append(i)
+
+    return active_tangokans
+
+
+def make_tangokan(tangoji):
+    tangokan = tangoji.copy()
+    tangokan["active_time"] = time.time() + TANGOKAN_WAIT_TIME
+    player_tangokans.append(tangokan)
+    tangoji_index.remove(tangoji)
+    tangoji_index.add(tangokan)
+
+
+def get_tangoji_key(word, clue):
+    # Key under which two tangojis count as the same, ignoring the
+    # case and surrounding space that grading ignores too.
+    return (word.lower().strip(), clue.lower().strip())
+
+
+def add_player_tangoji(word, clue, info=None):
+    # Give the player a new tangoji and return it.
+    tangoji = Tangoji(word=word, clue=clue, info=info)
+    player_tangojis.append(tangoji)
+    tangoji_index.add(tangoji)
+    return tangoji
+
+
+def change_tangoji(tangoji, word=None, clue=None, info=None):
+    # Change the fields of tangoji that aren't None.
+    tangoji_index.remove(tangoji)
+    if word is not None:
+        tangoji["word"] = word
+    if clue is not None:
+        tangoji["clue"] = clue
+    if info is not None:
+        tangoji["info"] = info
+    tangoji_index.add(tangoji)
+
+
+def import_tangojis(f, delimiter=None):
+    """
+    Add the tangojis listed in the text file ``f`` to the player's
+    tangojis.  Return the number added, the number skipped because the
+    player already had them and the number of lines that had no word
+    or no clue.
+
+    Each line has a word, its clue and optionally extra info, separated
+    by ``delimiter`` and quoted as in CSV files.  If ``delimiter`` is
+    None, it is taken from the "#separator:" header of an Anki text
+    export, or else it is a tab if the first line has one and a comma
+    otherwise.  The other "#" headers of Anki exports are followed too:
+    columns named by "#... column:" headers are left out, and HTML is
+    stripped from the fields if "#html:true" is given.  Only lines at
+    the start of the form "#name:value" are taken as headers, so a
+    first tangoji starting with "#" is not lost.
+
+    The file is read a line at a time, so it can be of any size.
+    ValueError is raised if the separator is not a single character or
+    the file can't be read as CSV.
+    """
+    skip_columns = set()
+    strip_html = False
+    first = ""
+    for first in f:
+        if not re.match(r"#[^\s:][^:]*:", first):
+            break
+
+        name, sep, value = first[1:].strip().partition(":")
+        name = name.strip().lower()
+        value = value.strip()
+        if name == "separator" and delimiter is None:
+            delimiter = TANGOJI_IMPORT_SEPARATORS.get(value.lower(), value)
+        elif name == "html":
+            strip_html = value.lower() == "true"
+        elif name.endswith(" column") and value.isdigit():
+            skip_columns.add(int(value) - 1)
+        first = ""
+
+    if delimiter is None:
+        delimiter = "\t" if "\t" in first else ","
+    if len(delimiter) != 1:
+        raise ValueError("invalid separator: {!r}".format(delimiter))
+
+    added = 0
+    duplicates = 0
+    invalid = 0
+    lines = itertools.chain([first] if first else [], f)
+    try:
+        for row in csv.reader(lines, delimiter=delimiter):
+            if not row:
+                continue
+
+            fields = [row[i] for i in range(len(row)) if i not in skip_columns]
+            if strip_html:
+                fields = [html.unescape(re.sub(r"<[^>]*>", "", field))
+                          for field in fields]
+            fields = [field.strip() for field in fields[:3]]
+            if len(fields) < 2 or not fields[0] or not fields[1]:
+                invalid += 1
+                continue
+
+            if tangoji_index.find(fields[0], fields[1]):
+                duplicates += 1
+                continue
+
+            info = fields[2] if len(fields) > 2 else ""
+            add_player_tangoji(fields[0], fields[1], info)
+            added += 1
+    except csv.Error as e:
+        raise ValueError(str(e))
+
+    return added, duplicates, invalid
+
+
+def find_tangomon():
+    """
+    Build the tangomon catalog from the files in each zone directory.
+
+    Only file metadata (name, extension, size and modification time) is
+    read here.  Decoding is left to :func:`get_tangomon_sprite`.
+    """
+    tangomon_catalog.clear()
+    for zone in ZONES:
+        tangomon_sets[zone] = set()
+        d = os.path.join(DATA, "images", "tangomon", zone)
+        with os.scandir(d) as entries:
+            for entry in entries:
+                root, ext = os.path.splitext(entry.name)
+                if ext.lower() not in IMAGE_EXTENSIONS:
+                    continue
+
+                try:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+
+                if st.st_size:
+                    tangomon_sets[zone].add(root)
+                    tangomon_catalog.setdefault(root, {
+                        "zone": zone, "path": entry.path,
+                        "size": st.st_size, "mtime": st.st_mtime})
+
+
+def index_tangomon():
+    """
+    Build the reverse index from each tangomon to its zone, the zone's
+    position in ``ZONES`` and the level offset of that zone.
+    """
+    tangomon_index.clear()
+    for i in range(len(ZONES)):
+        zone = ZONES[i]
+        offset = i * (len(tangomon_sets[zone]) + ZONE_BUFFER)
+        for tangomon in tangomon_sets[zone]:
+            tangomon_index.setdefault(tangomon, (zone, i, offset))
+
+
+def index_tangomon_encountered():
+    """Rebuild the encounter positions after a new ``tangomon_encountered``."""
+    tangomon_encountered_index.clear()
+    for zone in tangomon_encountered:
+        positions = {}
+        ect = tangomon_encountered[zone]
+        for i in range(len(ect)):
+            positions.setdefault(ect[i], i)
+        tangomon_encountered_index[zone] = positions
+
+
+def encounter_tangomon(zone, tangomon):
+    # Position of tangomon in the zone's encounter order, adding it to
+    # the end if this is its first encounter.
+    assert zone in ZONES and zone in tangomon_encountered
+    positions = tangomon_encountered_index.setdefault(zone, {})
+    j = positions.get(tangomon)
+    if j is None:
+        j = len(tangomon_encountered[zone])
+        tangomon_encountered[zone].append(tangomon)
+        positions[tangomon] = j
+
+    return j
+
+
+def get_tangomon_level(tangomon):
+    entry = tangomon_index.get(tangomon)
+    if entry is None:
+        warnings.warn('"{}" is not a valid Tangomon.'.format(tangomon))
+        return None
+
+    zone, zone_i, offset = entry
+    return encounter_tangomon(zone, tangomon) + offset
+
+
+def evaluate_tangomon(tangomon):
+    entry = tangomon_index.get(tangomon)
+    if entry is not None:
+        zone = entry[0]
+        assert zone in tangomon_encountered
+        tangomon_encountered[zone].append(tangomon)
+        tangomon_encountered_index.setdefault(zone, {}).setdefault(
+            tangomon, len(tangomon_encountered[zone]) - 1)
+        return
+
+    warnings.warn('"{}" is not a valid Tangomon.'.format(tangomon))
+
+
+def get_tangomon_hp_max(tangomon):
+    j = get_tangomon_level(tangomon)
+    if j is None:
+        return 1
+
+    return int(HEALTH_MAX_START * (HEALTH_INCREMENT_FACTOR ** j))
+
+
+def get_tangomon_base_power(tangomon):
+    j = get_tangomon_level(tangomon)
+    if j is None:
+        return 1
+
+    return BASE_POWER_START * (BASE_POWER_INCREMENT_FACTOR ** j)
+
+
+def get_tangomon_hp_buffed(tangomon):
+    # HP of a player's tangomon, buffed by its peers.
+    hp = get_tangomon_hp_max(tangomon)
+    avg_hp = roster_hp.get_peer_average(hp)
+    if avg_hp is not None:
+        hp = max(hp, int(avg_hp))
+
+    return hp
+
+
+def get_tangomon_power_buffed(tangomon):
+    # Power of a player's tangomon, buffed by its peers.
+    power = get_tangomon_base_power(tangomon)
+    avg_power = roster_power.get_peer_average(power)
+    if avg_power is not None:
+        power = max(power, int(avg_power))
+
+    return power
+
+
+def add_player_tangomon(tangomon):
+    global roster_version
+
+    player_tangomon.append(tangomon)
+    roster_version += 1
+    roster_hp.add(tangomon)
+    roster_power.add(tangomon)
+
+
+def remove_player_tangomon(i):
+    global roster_version
+
+    tangomon = player_tangomon.pop(i)
+    roster_version += 1
+    roster_hp.remove(tangomon)
+    roster_power.remove(tangomon)
+    return tangomon
+
+
+def invalidate_roster_stats():
+    global roster_version
+
+    roster_version += 1
+    roster_hp.invalidate()
+    roster_power.invalidate()
+
+
+def get_zone_tangomon_choices(zone):
+    # The tangomon a battle in zone can be fought against.  Tangomon the
+    # player doesn't have yet are preferred if a tangokan is ready.
+    tset = tangomon_sets[zone]
+    unique_tangomon = set(player_tangomon)
+    new_choices = [tangomon for tangomon in tset
+                   if tangomon not in unique_tangomon]
+    if new_choices and get_player_active_tangokans():
+        return new_choices
+    return list(tset)
+
+
+def give_starter_tangomon():
+    # Give the player a tangomon from the first zone if they have none.
+    if not player_tangomon:
+        zone = ZONES[0]
+        if tangomon_encountered[zone]:
+            add_player_tangomon(tangomon_encountered[zone][0])
+        else:
+            add_player_tangomon(random.choice(list(tangomon_sets[zone])))
+
+
+def grade_tangoji(tangoji, answer, time_left=0):
+    """
+    Check ``answer`` against ``tangoji`` and adjust the tangoji's power
+    accordingly.  Return the attack bonus the answer earned, which is 0
+    for a wrong answer.  ``time_left`` is how many frames of
+    ``TANGOJI_ENTRY_TIME`` were left when the answer was given.
+    """
+    word = tangoji.get("word", "")
+    tangoji.setdefault("power", TANGOJI_MULT_START)
+    if answer.lower().strip() == word.lower().strip():
+        bonus = tangoji["power"]
+        tangoji["power"] -= TANGOJI_MULT_DECREMENT
+        tangoji["power"] = max(tangoji["power"], TANGOJI_MULT_MIN)
+
+        bonus += TANGOJI_MULT_BULK_BONUS * len(player_tangojis)
+        if time_left > 0:
+            bonus += time_left * TANGOJI_MULT_TIME_BONUS
+    else:
+        tangoji["power"] += TANGOJI_MULT_DECREMENT
+        tangoji["power"] = min(tangoji["power"], TANGOJI_MULT_START)
+        bonus = 0
+
+    return bonus
+
+
+def get_attack_damage(base_power, bonus):
+    # Damage done by an attack of the player's tangomon, and whether it
+    # was a critical hit.
+    damage = int(base_power * bonus)
+    critical = random.random() < CRITICAL_CHANCE
+    if critical:
+        damage *= CRITICAL_MULT
+
+    return damage, critical
+
+
+def get_counterattack_damage(base_power):
+    # Damage done by the enemy after a failed attack.
+    damage = base_power * ENEMY_NERF
+    damage += random.uniform(-damage / 10, damage / 10)
+    return int(damage)
+
+
+def pass_tangojection(tangoji, now=None):
+    # Schedule the next test of a tangojection that was just passed,
+    # twice as far away as the last one.
+    if now is None:
+        now = time.time()
+
+    nt = tangoji.setdefault("next_time", DAY)
+    dev = random.uniform(-nt / 10, nt / 10)
+    tangoji["time"] = now + nt + dev
+    tangoji["next_time"] *= 2
+    player_tangojections.push(tangoji)
+
+
+def start_tangojection(tangoji, now=None):
+    # Turn a tangokan that was just used into a tangojection.
+    if now is None:
+        now = time.time()
+
+    wait = DAY
+    tangoji["time"] = now + wait
+    tangoji["next_time"] = wait * 2
+    player_tangojections.push(tangoji)
+
+
+def return_tangoji(tangoji, power=TANGOJI_MULT_START):
+    # Put a failed tangojection or tangokan back with the tangojis.
+    tangoji["power"] = power
+    player_tangojis.append(tangoji)
+
+
+def restore_tangoji_power():
+    # Bring the tangojis worn out in a battle back up to the minimum.
+    for tangoji in player_tangojis:
+        if tangoji.power is None:
+            tangoji["power"] = TANGOJI_MULT_START
+        elif tangoji.power < TANGOJI_MULT_PERSISTENT_MIN:
+            tangoji["power"] = TANGOJI_MULT_PERSISTENT_MIN
+
+
+def forecast_reviews(days, now=None, tangojections=None, jitter=False):
+    """
+    Return how many tests will fall due on each of the next ``days``
+    days, counted in whole days from ``now``, assuming every test is
+    passed on the day it falls due.
+
+    Tests that are already due count for the first day.  The schedule
+    of every tangojection is stepped forward together, one doubling of
+    the intervals at a time, using NumPy if it is available.  The ±10%
+    variation of the intervals is left out unless ``jitter`` is true.
+    """
+    # NumPy takes long to import, and only this needs it.
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    if now is None:
+        now = time.time()
+    if tangojections is None:
+        # The order doesn't matter, so the queue needn't be sorted.
+        tangojections = player_tangojections.values()
+    else:
+        tangojections = list(tangojections)
+
+    end = now + days * DAY
+    times = [max(t.get("time", 0), now) for t in tangojections]
+    intervals = [max(t.get("next_time", DAY), DAY) for t in tangojections]
+
+    if numpy is not None:
+        times = numpy.array(times, dtype=float)
+        intervals = numpy.array(intervals, dtype=float)
+        counts = numpy.zeros(days, dtype=numpy.int64)
+        while times.size:
+            keep = times < end
+            times = times[keep]
+            intervals = intervals[keep]
+            day = ((times - now) // DAY).astype(numpy.int64)
+            counts += numpy.bincount(day, minlength=days)[:days]
+            times += intervals
+            if jitter:
+                times += numpy.random.uniform(-intervals / 10,
+                                              intervals / 10)
+            intervals *= 2
+        return counts.tolist()
+
+    counts = [0] * days
+    while times:
+        due = [(t, n) for t, n in zip(times, intervals) if t < end]
+        for t, n in due:
+            counts[int((t - now) // DAY)] += 1
+        if jitter:
+            times = [t + n + random.uniform(-n / 10, n / 10) for t, n in due]
+        else:
+            times = [t + n for t, n in due]
+        intervals = [n * 2 for t, n in due]
+
+    return counts
+
+
+def apply_offline_results(time_code, failed_tests=(), failed_tangokans=()):
+    """
+    Apply the results of an offline session started at ``time_code``.
+
+    ``failed_tests`` are the IDs of the failed tests among the ones that
+    were due at ``time_code``, and ``failed_tangokans`` the IDs of the
+    failed tangokans.  Everything else that was due is passed.  All of
+    this is done in one pass over the due tests and the tangokans.
+    """
+    failed_tests = set(failed_tests)
+    failed_tangokans = set(failed_tangokans)
+
+    passed = []
+    i = 0
+    while player_tangojections.peek_due(time_code) is not None:
+        tangoji = player_tangojections.pop_due(time_code)
+        if i in failed_tests:
+            return_tangoji(tangoji)
+        else:
+            passed.append(tangoji)
+        i += 1
+
+    # Passed tests are only put back once all due tests are out, so
+    # that an odd interval can't make one come up twice.
+    for tangoji in passed:
+        pass_tangojection(tangoji, time_code)
+
+    tangokans = []
+    for i in range(len(player_tangokans)):
+        tangokan = player_tangokans[i]
+        if i in failed_tangokans:
+            return_tangoji(tangokan)
+            continue
+
+        tangokan.setdefault("active_time", time_code + TANGOKAN_WAIT_TIME)
+        if time_code >= tangokan["active_time"]:
+            start_tangojection(tangokan, time_code)
+        else:
+            tangokans.append(tangokan)
+
+    player_tangokans[:] = tangokans
+
+
+def iter_offline_entries(entries, answers=False,
+                         info_template="{tangoji} ({info})"):
+    # Lines listing entries, which are pairs of an ID and a tangoji, on
+    # the offline session sheet or, if answers, its answer key.
+    list_template = "* {}: {}"
+    separator = ""
+    for i, tangoji in entries:
+        if not answers:
+            text = tangoji["clue"]
+        elif tangoji.get("info"):
+            text = info_template.format(tangoji=tangoji["word"],
+                                        info=tangoji["info"])
+        else:
+            text = tangoji["word"]
+
+        yield separator + list_template.format(i, text)
+        separator = "\n"
+
+
+def write_offline_session(path, template, time_code, answers=False,
+                          info_template="{tangoji} ({info})"):
+    """
+    Write the offline session sheet for the time code ``time_code`` or,
+    if ``answers`` is true, its answer key, to the file at ``path``, or
+    to standard output if ``path`` is "-".  Return the number of entries
+    written for each of the lists in ``template``.
+
+    ``template`` is filled in as it is written, so the lists of
+    tangojis are never held in memory as a whole.  ``info_template``
+    is used on the answer key for tangojis that have extra info.
+    """
+    entries = {
+        "tangojections": lambda: enumerate(
+            player_tangojections.iter_due(time_code)),
+        "tangojis": lambda: enumerate(player_tangojis),
+        "tangokans": lambda: (
+            (i, player_tangokans[i])
+            for i in get_player_active_tangokans(time_code))}
+    values = {"name": player_name, "time_code": time_code}
+    counts = {}
+
+    if path == "-":
+        f = sys.stdout
+    else:
+        f = open(path, 'w', encoding="utf-8", buffering=OFFLINE_BUFFER_SIZE)
+
+    try:
+        formatter = string.Formatter()
+        for literal, field, spec, conversion in formatter.parse(template):
+            f.write(literal)
+            if field in entries:
+                n = 0
+                for line in iter_offline_entries(entries[field](), answers,
+                                                 info_template):
+                    f.write(line)
+                    n += 1
+                counts[field] = n
+            elif field is not None:
+                value = formatter.convert_field(values[field], conversion)
+                f.write(formatter.format_field(value, spec))
+    finally:
+        if f is sys.stdout:
+            f.flush()
+        else:
+            f.close()
+
+    return counts
+
+
+def check_offline_results(time_code, failed_tests=(), failed_tangokans=()):
+    """
+    Check the results of an offline session against the game that is
+    loaded and return a list of the problems found, which is empty if
+    they can be applied.
+
+    Each problem is a pair: ``("time_code", time_code)`` if the time
+    code is in the future, ``("test", i)`` for a failed test that was
+    not due at the time code and ``("tangokan", i)`` for a failed
+    tangokan that was not active then.
+    """
+    if time_code > time.time():
+        return [("time_code", time_code)]
+
+    problems = []
+    n_tests = sum(1 for t in player_tangojections.iter_due(time_code))
+    for i in sorted(failed_tests):
+        if not 0 <= i < n_tests:
+            problems.append(("test", i))
+
+    for i in sorted(failed_tangokans):
+        if not 0 <= i < len(player_tangokans):
+            active = False
+        else:
+            active_time = player_tangokans[i].get("active_time")
+            active = active_time is not None and time_code >= active_time
+        if not active:
+            problems.append(("tangokan", i))
+
+    return problems
+
+
+def init_offline_worker(data_dir, config_dir, nosave):
+    # Set up a process of a batch offline run like the one starting it.
+    # Journals are never rotated or compacted here, since other workers
+    # and the parent share the files; a later save by the game takes
+    # care of it.
+    global DATA
+    global NOSAVE
+    global save_compaction
+    DATA = data_dir
+    NOSAVE = nosave
+    save_compaction = False
+    set_config_dir(config_dir)
+    load_config()
+    load_save_index()
+
+
+def run_offline_job(job):
+    """
+    Do the offline work for one save slot and return a summary of it.
+
+    ``job`` is a dictionary with the index of the slot as ``"slot"``.
+    If it has ``"results"``, a tuple of arguments for
+    :func:`apply_offline_results`, they are checked and applied and the
+    slot is saved.  Otherwise the session sheet and its answer key are
+    written for ``"time_code"`` to ``"output"`` and ``"answers"``, with
+    ``"template"``, ``"answers_template"`` and ``"info_template"`` as
+    for :func:`write_offline_session`.
+
+    Only the slot itself is written, not the save index or the
+    settings, which is left to :func:`run_offline_jobs`.
+
+    The summary has the slot, the player's name, the new save summary
+    as ``"index"`` and either the number of entries written or the
+    problems found with the results.  ``"error"`` is set instead to
+    ``"load"`` if the slot could not be loaded, or to ``"save"`` if the
+    results could not be saved, with the reason as ``"save_error"``.
+    """
+    global current_save_slot
+
+    i = job["slot"]
+    summary = {"slot": i, "name": None}
+    current_save_slot = i
+    if not load_game():
+        summary["error"] = "load"
+        return summary
+
+    summary["name"] = player_name
+    if "results" in job:
+        time_code, failed_tests, failed_tangokans = job["results"]
+        summary["time_code"] = time_code
+        summary["problems"] = check_offline_results(*job["results"])
+        if not summary["problems"]:
+            summary["tests"] = sum(
+                1 for t in player_tangojections.iter_due(time_code))
+            summary["failed_tests"] = len(failed_tests)
+            summary["failed_tangokans"] = len(failed_tangokans)
+            apply_offline_results(*job["results"])
+            save_game(settings=False)
+            if not flush_saves():
+                summary["error"] = "save"
+                summary["save_error"] = str(save_error)
+                return summary
+    else:
+        summary["time_code"] = job["time_code"]
+        summary["output"] = job["output"]
+        summary["answers"] = job["answers"]
+        summary["counts"] = write_offline_session(
+            job["output"], job["template"], job["time_code"],
+            info_template=job["info_template"])
+        write_offline_session(
+            job["answers"], job["answers_template"], job["time_code"],
+            answers=True, info_template=job["info_template"])
+
+    summary["index"] = save_slots[i]
+    return summary
+
+
+def run_offline_jobs(jobs, processes=1):
+    """
+    Run each of ``jobs`` with :func:`run_offline_job` and return their
+    summaries in the same order.
+
+    With more than one process, the slots are loaded and processed in
+    a pool of that many processes.  Either way, the save index is
+    written here once all of the jobs are done; use
+    :func:`flush_saves` to find out whether it was.
+    """
+    if processes <= 1:
+        summaries = [run_offline_job(job) for job in jobs]
+    else:
+        # The workers must not find a journal being compacted.
+        flush_saves()
+        for thread in list(save_compact_threads.values()):
+            thread.join()
+
+        with concurrent.futures.ProcessPoolExecutor(
+                processes, initializer=init_offline_worker,
+                initargs=(DATA, CONFIG, NOSAVE)) as pool:
+            summaries = list(pool.map(run_offline_job, jobs))
+
+    # Other processes only know about the slots they saved themselves.
+    changed = False
+    for job, summary in zip(jobs, summaries):
+        if "results" in job and "index" in summary:
+            save_slots[summary["slot"]] = summary["index"]
+            changed = True
+    if changed:
+        write_to_disk()
+        flush_saves()
+
+    return summaries
+
+
+def reset_game():
+    global player_zone
+    global player_tangomon
+    global tangomon_encountered
+    player_zone = 0
+    player_tangomon = []
+    tangomon_encountered = {}
+    for i in ZONES:
+        tangomon_encountered[i] = []
+    index_tangomon_encountered()
+    invalidate_roster_stats()
+
+
+def new_game(name):
+    global player_name
+    global player_zone
+    global player_tangojis
+    global player_tangokans
+    global player_tangomon
+    global player_tangojections
+    global tangomon_encountered
+    global next_tangoji_id
+    player_name = name
+    player_zone = 0
+    player_tangojis = []
+    player_tangokans = []
+    player_tangomon = []
+    player_tangojections = ReviewQueue()
+    next_tangoji_id = 1
+    tangomon_encountered = {}
+    for i in ZONES:
+        tangomon_encountered[i] = []
+    index_tangomon_encountered()
+    invalidate_roster_stats()
+    tangoji_index.invalidate()
+
+
+def save_game(settings=True):
+    """
+    Save the game being played to its slot.  If ``settings`` is false,
+    only the slot is written, not the save index or the settings; see
+    :func:`write_to_disk`.
+    """
+    global next_tangoji_id
+
+    if not NOSAVE:
+        if current_save_slot is not None:
+            # Give new tangojis (and copies of old ones) an ID of their
+            # own, which the save journal knows them by.
+            ids = set()
+            for tangoji in itertools.chain(player_tangojis, player_tangokans,
+                                           player_tangojections.values()):
+                if tangoji.id is None or tangoji.id in ids:
+                    tangoji["id"] = next_tangoji_id
+                    next_tangoji_id += 1
+                ids.add(tangoji.id)
+
+            # The save thread writes this later, so it gets copies of
+            # everything the game may still change.
+            slot = {
+                "version": 1,
+                "player_name": player_name,
+                "player_zone": player_zone,
+                "player_tangojis": [d.get_saved() for d in player_tangojis],
+                "player_tangokans": [
+                    d.get_saved() for d in player_tangokans],
+                "player_tangomon": list(player_tangomon),
+                "player_tangojections": [
+                    d.get_saved() for d in player_tangojections.values()],
+                "tangomon_encountered": {
+                    zone: list(ect)
+                    for zone, ect in tangomon_encountered.items()}}
+            loaded_save_slots[current_save_slot] = slot
+            save_slots[current_save_slot] = get_save_summary(slot)
+            dirty_save_slots.add(current_save_slot)
+
+        write_to_disk(settings)
+
+
+def load_game():
+    global player_name
+    global player_zone
+    global player_tangojis
+    global player_tangokans
+    global player_tangomon
+    global player_tangojections
+    global tangomon_encountered
+    global next_tangoji_id
+
+    if (current_save_slot is not None and
+            save_slots[current_save_slot] is not None):
+        slot = read_save_slot(current_save_slot)
+        if slot is None:
+            return False
+
+        # Only the slot being played needs to stay in memory.
+        for i in list(loaded_save_slots):
+            if i != current_save_slot and i not in dirty_save_slots:
+                del loaded_save_slots[i]
+                save_journal_cache.pop(i, None)
+
+        player_name = slot.get("player_name")
+        player_zone = slot.get("player_zone", 0)
+        player_tangojis = [load_tangoji(d)
+                           for d in slot.get("player_tangojis", [])]
+        player_tangokans = [load_tangoji(d)
+                            for d in slot.get("player_tangokans", [])]
+        player_tangomon = slot.get("player_tangomon", [])
+        tangojections = slot.get("player_tangojections", [])
+        tangomon_encountered = slot.get("tangomon_encountered", {})
+        for i in ZONES:
+            tangomon_encountered.setdefault(i, [])
+        index_tangomon_encountered()
+        invalidate_roster_stats()
+
+        if slot.get("version", 0) < 1:
+            # Older versions kept every upcoming test of a tangojection
+            # as an entry of its own; keep the first one of each.
+            groups = {}
+            for d in tangojections:
+                groups.setdefault((d["word"], d["clue"]), []).append(d)
+
+            tangojections = []
+            for group in groups.values():
+                tj1 = group[0]
+                if len(group) >= 2:
+                    tj1["next_time"] = group[1]["time"] - tj1["time"]
+                else:
+                    tj1["next_time"] = 36 * MONTH
+                tangojections.append(tj1)
+
+        player_tangojections = ReviewQueue(load_tangoji(d)
+                                           for d in tangojections)
+        next_tangoji_id = max(
+            [t.id for t in itertools.chain(
+                player_tangojis, player_tangokans,
+                player_tangojections.values()) if t.id is not None],
+            default=0) + 1
+        tangoji_index.invalidate()
+    else:
+        return False
+
+    return True
+
+
+def load_tangoji(data):
+    # Make a tangoji from its saved dictionary.  If nothing is lost on
+    # the way, the dictionary is kept as what it was last saved as.
+    tangoji = Tangoji(data)
+    if tangoji.id is not None and tangoji.to_dict() == data:
+        tangoji.saved = data
+    return tangoji
+
+
+def set_config_dir(path):
+    # Use the settings and saves in the directory at path.
+    global CONFIG
+    global CONFIG_PATH
+    global SAVE_SLOTS_PATH
+    global SAVE_SLOTS_BACKUP_PATH
+    global SAVE_JOURNAL_PATH
+    global SAVE_JOURNAL_OLD_PATH
+    global SAVE_DIR
+    global SAVE_INDEX_PATH
+
+    CONFIG = path
+    CONFIG_PATH = os.path.join(CONFIG, "config.json")
+    # Save files of older versions, which kept every slot in one file.
+    SAVE_SLOTS_PATH = os.path.join(CONFIG, "save_slots.json")
+    SAVE_SLOTS_BACKUP_PATH = os.path.join(CONFIG, "save_slots.json~")
+    SAVE_JOURNAL_PATH = os.path.join(CONFIG, "save_slots.journal")
+    SAVE_JOURNAL_OLD_PATH = os.path.join(CONFIG, "save_slots.journal.old")
+    SAVE_DIR = os.path.join(CONFIG, "saves")
+    SAVE_INDEX_PATH = os.path.join(SAVE_DIR, "index.json")
+
+
+def load_config():
+    """
+    Read the settings file into ``config`` and return it.
+
+    Only the save settings are used here; the rest are kept as they are
+    and written back along with them.
+    """
+    global save_backups
+    global save_format
+
+    if not os.path.exists(CONFIG):
+        os.makedirs(CONFIG)
+    if not os.path.exists(SAVE_DIR):
+        os.makedirs(SAVE_DIR)
+
+    try:
+        with open(CONFIG_PATH) as f:
+            cfg = json.load(f)
+    except (OSError, ValueError):
+        cfg = {}
+
+    config.clear()
+    config.update(cfg)
+    try:
+        save_backups = int(config.get("save_backups", save_backups))
+    except (TypeError, ValueError):
+        save_backups = SAVE_BACKUPS
+    if save_backups < 0:
+        save_backups = SAVE_BACKUPS
+    save_format = config.get("save_format", save_format)
+    if save_format not in SAVE_FORMATS:
+        save_format = "json"
+
+    return config
+
+
+def load_save_index():
+    """
+    Read the summaries of the save slots into ``save_slots``, bringing
+    the save files of older versions up to date if needed.
+    """
+    global save_index_text
+
+    # Older versions may have left a backup behind after being interrupted.
+    if os.path.exists(SAVE_SLOTS_BACKUP_PATH):
+        if os.path.exists(SAVE_SLOTS_PATH):
+            os.remove(SAVE_SLOTS_PATH)
+        os.rename(SAVE_SLOTS_BACKUP_PATH, SAVE_SLOTS_PATH)
+
+    try:
+        with open(SAVE_INDEX_PATH) as f:
+            save_index_text = f.read()
+        loaded_index = json.loads(save_index_text)
+    except (OSError, ValueError):
+        rebuild_save_index()
+    else:
+        for i in range(min(len(loaded_index), len(save_slots))):
+            save_slots[i] = loaded_index[i]
+
+    # Finish any compaction that was interrupted last time.
+    if not NOSAVE:
+        for i in range(SAVE_NSLOTS):
+            if os.path.exists(get_save_slot_path(i, ".journal.old")):
+                start_save_compaction(i)
+
+
+def write_to_disk(settings=True):
+    """
+    Have our saves and settings written to disk by the save thread.
+
+    Anything still waiting to be written is merged with what is passed
+    on now, so saving again before the thread gets to it costs nothing
+    extra.  Use :func:`flush_saves` to wait for it to be written.
+
+    If ``settings`` is false, only the save slots are written, not the
+    save index or the settings.  This is for processes that share the
+    configuration directory with another one that writes those.
+    """
+    global save_thread
+    global pending_save
+
+    if not NOSAVE:
+        restore_failed_save()
+        cfg = dict(config)
+        cfg.update({"version": 0, "save_backups": save_backups,
+                    "save_format": save_format})
+
+        slots = {}
+        for i in dirty_save_slots:
+            slots[i] = loaded_save_slots.get(i)
+        dirty_save_slots.clear()
+
+        with save_condition:
+            if pending_save is None:
+                pending_save = {"slots": {}}
+            pending_save["slots"].update(slots)
+            if settings:
+                pending_save["config"] = cfg
+                pending_save["index"] = list(save_slots)
+            save_condition.notify_all()
+
+        if save_thread is None or not save_thread.is_alive():
+            save_thread = threading.Thread(target=run_save_thread,
+                                           daemon=True)
+            save_thread.start()
+
+
+def flush_saves():
+    """
+    Wait until everything passed to :func:`write_to_disk` has been
+    written, and return whether it all was.
+
+    If not, ``save_error`` is the error that stopped it, and the save
+    slots that weren't written are written along with the next save.
+    """
+    with save_condition:
+        while pending_save is not None or save_busy:
+            save_condition.wait()
+        return failed_save is None
+
+
+def restore_failed_save():
+    # Put the save slots the save thread could not write back among the
+    # ones to write, unless they have been changed since.
+    global failed_save
+
+    with save_condition:
+        failed = failed_save
+        failed_save = None
+
+    if failed is not None:
+        for i, slot in failed["slots"].items():
+            if i not in dirty_save_slots:
+                loaded_save_slots[i] = slot
+                dirty_save_slots.add(i)
+
+
+def run_save_thread():
+    global pending_save
+    global failed_save
+    global save_error
+    global save_busy
+
+    while True:
+        with save_condition:
+            while pending_save is None:
+                save_condition.wait()
+            snapshot = pending_save
+            pending_save = None
+            save_busy = True
+
+        error = None
+        try:
+            write_save_snapshot(snapshot)
+        except Exception as e:
+            error = e
+            warnings.warn("Could not save the game: {!r}".format(e))
+        finally:
+            with save_condition:
+                save_busy = False
+                save_error = error
+                if error is not None:
+                    failed_save = snapshot
+                save_condition.notify_all()
+
+
+def write_save_snapshot(snapshot):
+    """
+    Write what ``snapshot`` holds.  Each part is removed from it once
+    it is written, so if this fails, what is left in it is what still
+    needs to be written.
+    """
+    global save_index_text
+
+    for i in sorted(snapshot["slots"]):
+        # The cache is only kept once the changes are on the disk, so
+        # that a failed save is compared against what is really there
+        # next time.
+        changes, cache = get_save_changes(snapshot["slots"][i],
+                                          save_journal_cache.get(i))
+        if changes:
+            write_save_changes(i, changes)
+        save_journal_cache[i] = cache
+        del snapshot["slots"][i]
+
+    if "config" in snapshot:
+        write_file_atomic(CONFIG_PATH,
+                          json.dumps(snapshot["config"], indent=4))
+        del snapshot["config"]
+
+    if "index" in snapshot:
+        index_text = json.dumps(snapshot["index"], indent=4)
+        if index_text != save_index_text:
+            write_file_atomic(SAVE_INDEX_PATH, index_text)
+            save_index_text = index_text
+        del snapshot["index"]
+
+
+def write_file_atomic(path, text, backups=0):
+    """
+    Replace the file at ``path`` with ``text`` (a string or bytes).
+
+    The text is written to a temporary file and flushed to the disk
+    before being renamed over the old file, so the file is always
+    either the old version or the new one, never something in between.
+    The temporary file has a name of its own, so several processes can
+    write files in the same directory at once.  If ``backups`` is
+    nonzero, that many previous versions are kept as ``path.1`` (the
+    newest), ``path.2`` and so on.
+    """
+    if isinstance(text, str):
+        text = text.encode("utf-8")
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=os.path.basename(path) + ".", suffix=".tmp",
+        dir=os.path.dirname(path) or os.curdir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if backups and os.path.exists(path):
+            for n in range(backups - 1, 0, -1):
+                old_backup = "{}.{}".format(path, n)
+                if os.path.exists(old_backup):
+                    os.replace(old_backup, "{}.{}".format(path, n + 1))
+
+            backup = path + ".1"
+            if os.path.exists(backup):
+                os.remove(backup)
+            try:
+                os.link(path, backup)
+            except (OSError, AttributeError):
+                shutil.copy2(path, backup)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # Make sure the rename itself reaches the disk.  Not every system
+    # can open a directory, so this is only done where possible.
+    try:
+        fd = os.open(os.path.dirname(path) or os.curdir, os.O_RDONLY)
+    except OSError:
+        pass
+    else:
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def get_save_slot_path(i, ext=".json"):
+    return os.path.join(SAVE_DIR, "slot{}{}".format(i + 1, ext))
+
+
+def get_save_summary(slot):
+    # The little bit of a save slot that is kept in the index.
+    if slot is None:
+        return None
+
+    return {"player_name": slot.get("player_name"),
+            "player_zone": slot.get("player_zone", 0),
+            "tangomon": len(slot.get("player_tangomon", [])),
+            "tangojis": len(slot.get("player_tangojis", [])),
+            "tangokans": len(slot.get("player_tangokans", [])),
+            "tangojections": len(slot.get("player_tangojections", []))}
+
+
+def get_save_table(value):
+    # If value is a list of records that all have an ID of their own,
+    # return a dictionary of them by ID, in the same order; otherwise,
+    # return None.
+    if not isinstance(value, list):
+        return None
+
+    table = {}
+    for record in value:
+        if not isinstance(record, dict):
+            return None
+        record_id = record.get("id")
+        if record_id is None or record_id in table:
+            return None
+        table[record_id] = record
+
+    return table
+
+
+def get_save_cache(slot):
+    # What a save slot was saved as, to compare later saves against:
+    # lists of records as tables of the very same records by ID, and
+    # everything else serialized.
+    if slot is None:
+        return None
+
+    cache = {}
+    for key, value in slot.items():
+        table = get_save_table(value)
+        if table is not None:
+            cache[key] = table
+        else:
+            cache[key] = json.dumps(value, sort_keys=True)
+
+    return cache
+
+
+def get_save_changes(slot, old_cache):
+    """
+    Return the journal changes for everything in ``slot`` that differs
+    from ``old_cache``, along with the cache for the slot as it is now.
+
+    Lists of records are compared by ID, so that only the records
+    that were added, changed or removed are written.  A record that is
+    the very same object it was last saved as is taken to be unchanged
+    without looking at it; see :meth:`Tangoji.get_saved`.
+    """
+    if slot is None or old_cache is None:
+        cache = get_save_cache(slot)
+        if slot is None and old_cache is None:
+            return [], cache
+        return [{"value": slot}], cache
+
+    cache = {}
+    changes = []
+    for key, value in slot.items():
+        old = old_cache.get(key)
+        table = get_save_table(value)
+        if table is not None and isinstance(old, dict):
+            cache[key] = table
+            records = []
+            for record_id, record in table.items():
+                old_record = old.get(record_id)
+                if old_record is not record and old_record != record:
+                    records.append(record)
+            deleted = [record_id for record_id in old
+                       if record_id not in table]
+
+            change = {"key": key}
+            if key not in SAVE_UNORDERED_KEYS:
+                kept = [record_id for record_id in table if record_id in old]
+                old_kept = [record_id for record_id in old
+                            if record_id in table]
+                if kept != old_kept:
+                    change["order"] = list(table)
+
+            if records or deleted or "order" in change:
+                change["records"] = records
+                change["deleted"] = deleted
+                changes.append(change)
+        elif table is not None:
+            cache[key] = table
+            changes.append({"key": key, "value": value})
+        else:
+            cache[key] = json.dumps(value, sort_keys=True)
+            if cache[key] != old:
+                changes.append({"key": key, "value": value})
+
+    for key in old_cache:
+        if key not in cache:
+            changes.append({"key": key, "deleted": True})
+
+    return changes, cache
+
+
+def apply_save_change(slot, change):
+    # Return slot with the journal change applied.  Changes to records
+    # by ID are applied by apply_save_changes().
+    if "key" not in change:
+        return change["value"]
+
+    if slot is None:
+        slot = {}
+
+    key = change["key"]
+    if change.get("deleted") is True:
+        slot.pop(key, None)
+    elif "length" in change:
+        # Written by older versions, which kept records by position.
+        value = slot.get(key)
+        if not isinstance(value, list):
+            value = []
+        length = change["length"]
+        del value[length:]
+        value.extend([None] * (length - len(value)))
+        for j, v in change["items"].items():
+            value[int(j)] = v
+        slot[key] = value
+    else:
+        slot[key] = change["value"]
+
+    return slot
+
+
+def apply_save_changes(slot, changes):
+    """
+    Return ``slot`` with the journal ``changes`` applied in order.
+
+    Lists changed by ID are kept as tables by ID until the end, so
+    replaying a long journal costs time in proportion to its size, not
+    to the size of the lists.  A record changed by ID stays where it
+    was; a new one goes at the end.
+    """
+    tables = {}
+    for change in changes:
+        if "records" not in change:
+            if "key" not in change:
+                tables.clear()
+            else:
+                table = tables.pop(change["key"], None)
+                if table is not None and slot is not None:
+                    slot[change["key"]] = list(table.values())
+            slot = apply_save_change(slot, change)
+            continue
+
+        if slot is None:
+            slot = {}
+        key = change["key"]
+        table = tables.get(key)
+        if table is None:
+            value = slot.get(key)
+            table = {}
+            if isinstance(value, list):
+                for record in value:
+                    if isinstance(record, dict) and "id" in record:
+                        table[record["id"]] = record
+            tables[key] = table
+
+        for record_id in change.get("deleted", []):
+            table.pop(record_id, None)
+        for record in change["records"]:
+            table[record["id"]] = record
+        if "order" in change:
+            tables[key] = {record_id: table[record_id]
+                           for record_id in change["order"]
+                           if record_id in table}
+
+    for key, table in tables.items():
+        slot[key] = list(table.values())
+
+    return slot
+
+
+def read_save_journal(path, truncate=False):
+    """
+    Yield the changes recorded in the journal at ``path``.
+
+    A save that was cut off while being written is ignored; if
+    ``truncate`` is true, it is also removed from the file so that new
+    saves are not appended after it.
+    """
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return
+
+    with f:
+        good_size = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line.decode("utf-8"))
+            except ValueError:
+                break
+
+            for change in entry.get("changes", []):
+                yield change
+            good_size += len(line)
+
+    if truncate and good_size < os.path.getsize(path):
+        with open(path, 'r+b') as f:
+            f.truncate(good_size)
+
+
+def read_save_slot_file(i):
+    # Read save slot i as of its last compaction, in whichever format
+    # it was last written in.
+    paths = []
+    for ext in SAVE_FORMATS.values():
+        path = get_save_slot_path(i, ext)
+        if os.path.exists(path):
+            paths.append(path)
+
+    if not paths:
+        return None
+
+    path = max(paths, key=os.path.getmtime)
+    try:
+        with open(path, 'rb') as f:
+            return decode_save_slot(f.read())
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def write_save_slot_file(i, slot, backups=0):
+    # Write save slot i in the configured format and get rid of any
+    # copy left over in another format.
+    path = get_save_slot_path(i, SAVE_FORMATS[save_format])
+    write_file_atomic(path, encode_save_slot(slot, save_format),
+                      backups=backups)
+    for ext in SAVE_FORMATS.values():
+        other_path = get_save_slot_path(i, ext)
+        if other_path != path and os.path.exists(other_path):
+            os.remove(other_path)
+
+
+def encode_save_slot(slot, fmt="json"):
+    """
+    Encode a save slot as bytes in the format ``fmt``.
+
+    The "json" format is the same JSON the game has always used.  The
+    "binary" format stores lists of records (the tangoji decks) by
+    column: numbers as packed arrays and strings as indexes into a
+    single table in which each distinct string appears once.  Anything
+    else is kept as JSON.
+    """
+    if fmt != "binary":
+        return json.dumps(slot, indent=4).encode("utf-8")
+
+    missing = object()
+    strings = []
+    string_ids = {}
+    tables = {}
+    sections = []
+
+    def add_section(data):
+        if sys.byteorder != "little" and isinstance(data, array.array):
+            data = array.array(data.typecode, data)
+            data.byteswap()
+        if isinstance(data, array.array):
+            data = data.tobytes()
+        sections.append(struct.pack("<I", len(data)))
+        sections.append(data)
+
+    header_slot = {}
+    for key, value in (slot or {}).items():
+        if (isinstance(value, list) and value and
+                all(isinstance(v, dict) for v in value)):
+            names = []
+            for record in value:
+                for name in record:
+                    if name not in names:
+                        names.append(name)
+
+            columns = []
+            for name in names:
+                column = [record.get(name, missing) for record in value]
+                present = [v for v in column if v is not missing]
+                masked = len(present) < len(column)
+                if all(isinstance(v, float) for v in present):
+                    typecode = 'd'
+                elif all(isinstance(v, int) and not isinstance(v, bool)
+                         for v in present):
+                    typecode = 'q'
+                elif all(v is None or isinstance(v, str) for v in present):
+                    typecode = 's'
+                else:
+                    typecode = 'j'
+
+                if typecode in {'d', 'q'}:
+                    add_section(array.array(typecode, [
+                        0 if v is missing else v for v in column]))
+                    if masked:
+                        add_section(bytes([v is not missing
+                                           for v in column]))
+                elif typecode == 's':
+                    # 0 is a missing value, 1 is None, and anything
+                    # higher is a string from the string table.
+                    ids = array.array('I')
+                    for v in column:
+                        if v is missing:
+                            ids.append(0)
+                        elif v is None:
+                            ids.append(1)
+                        else:
+                            j = string_ids.get(v)
+                            if j is None:
+                                j = len(strings)
+                                string_ids[v] = j
+                                strings.append(v)
+                            ids.append(j + 2)
+                    add_section(ids)
+                    masked = False
+                else:
+                    add_section(json.dumps(
+                        [[j, column[j]] for j in range(len(column))
+                         if column[j] is not missing]).encode("utf-8"))
+                    masked = False
+
+                columns.append([name, typecode, masked])
+
+            tables[key] = {"length": len(value), "columns": columns}
+        else:
+            header_slot[key] = value
+
+    header = json.dumps({"slot": header_slot if slot is not None else None,
+                         "tables": tables}).encode("utf-8")
+    string_table = json.dumps(strings).encode("utf-8")
+    return b"".join([SAVE_BINARY_MAGIC, struct.pack("<I", len(header)),
+                     header, struct.pack("<I", len(string_table)),
+                     string_table] + sections)
+
+
+def decode_save_slot(data):
+    """Decode a save slot encoded by :func:`encode_save_slot`."""
+    if not data.startswith(SAVE_BINARY_MAGIC):
+        return json.loads(data.decode("utf-8"))
+
+    pos = len(SAVE_BINARY_MAGIC)
+
+    def read_section():
+        nonlocal pos
+        size, = struct.unpack_from("<I", data, pos)
+        pos += 4 + size
+        if pos > len(data):
+            raise ValueError("Save data is truncated.")
+        return data[pos - size:pos]
+
+    header = json.loads(read_section().decode("utf-8"))
+    missing = object()
+    strings = [missing, None] + json.loads(read_section().decode("utf-8"))
+    slot = header["slot"]
+    if slot is None:
+        return None
+
+    for key, table in header["tables"].items():
+        records = [{} for j in range(table["length"])]
+        for name, typecode, masked in table["columns"]:
+            if typecode in {'d', 'q'}:
+                column = array.array(typecode)
+                column.frombytes(read_section())
+                if sys.byteorder != "little":
+                    column.byteswap()
+                column = column.tolist()
+                if masked:
+                    mask = read_section()
+                    column = [column[j] if mask[j] else missing
+                              for j in range(len(column))]
+            elif typecode == 's':
+                ids = array.array('I')
+                ids.frombytes(read_section())
+                if sys.byteorder != "little":
+                    ids.byteswap()
+                column = [strings[j] for j in ids]
+            else:
+                column = [missing] * table["length"]
+                for j, v in json.loads(read_section().decode("utf-8")):
+                    column[j] = v
+
+            for record, v in zip(records, column):
+                if v is not missing:
+                    record[name] = v
+
+        slot[key] = records
+
+    return slot
+
+
+def read_save_slot(i):
+    """
+    Return the full contents of save slot ``i``, reading it from its
+    file and journals if it is not in memory yet.
+    """
+    # The save thread may still be writing to the slot's files.
+    flush_saves()
+    restore_failed_save()
+
+    if i not in loaded_save_slots:
+        # A compaction removes the old journal once it is done with it,
+        # so reading the files at the same time is not safe.
+        thread = save_compact_threads.get(i)
+        if thread is not None:
+            thread.join()
+
+        slot = apply_save_changes(read_save_slot_file(i), itertools.chain(
+            read_save_journal(get_save_slot_path(i, ".journal.old")),
+            read_save_journal(get_save_slot_path(i, ".journal"),
+                              truncate=True)))
+
+        loaded_save_slots[i] = slot
+        save_journal_cache[i] = get_save_cache(slot)
+
+        # Bring the file over to a newly chosen format right away.
+        if not NOSAVE and is_save_slot_file_outdated(i):
+            rotate_save_journal(i)
+
+    return loaded_save_slots[i]
+
+
+def write_save_changes(i, changes):
+    # All changes from one save go on a single line, so that a save is
+    # either entirely in the journal or not at all.
+    journal_path = get_save_slot_path(i, ".journal")
+    line = json.dumps({"changes": changes}) + "\n"
+    with open(journal_path, 'a', encoding="utf-8") as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+    if (os.path.getsize(journal_path) > SAVE_JOURNAL_COMPACT_SIZE or
+            is_save_slot_file_outdated(i)):
+        rotate_save_journal(i)
+
+
+def is_save_slot_file_outdated(i):
+    # Whether save slot i has a file in a format other than the one
+    # configured.
+    ext = SAVE_FORMATS[save_format]
+    return any(os.path.exists(get_save_slot_path(i, other_ext))
+               for other_ext in SAVE_FORMATS.values() if other_ext != ext)
+
+
+def rotate_save_journal(i):
+    # Hand the journal of save slot i, if any, over to a compaction,
+    # which also writes the slot's file in the configured format.  This
+    # waits for the next save if a compaction is still going on.
+    if not save_compaction:
+        return
+
+    journal_path = get_save_slot_path(i, ".journal")
+    old_journal_path = get_save_slot_path(i, ".journal.old")
+    if not os.path.exists(old_journal_path):
+        if os.path.exists(journal_path):
+            os.replace(journal_path, old_journal_path)
+        start_save_compaction(i)
+
+
+def compact_save_journal(i):
+    """
+    Fold the rotated journal of save slot ``i`` into the slot's file.
+
+    This runs on its own thread and works only with the files, never
+    with the game state.  Replaying a journal twice gives the same
+    result, so being interrupted at any point is harmless.
+    """
+    old_journal_path = get_save_slot_path(i, ".journal.old")
+    slot = apply_save_changes(read_save_slot_file(i),
+                              read_save_journal(old_journal_path))
+
+    write_save_slot_file(i, slot, backups=save_backups)
+    if os.path.exists(old_journal_path):
+        os.remove(old_journal_path)
+
+
+def start_save_compaction(i):
+    if not save_compaction:
+        return
+
+    thread = save_compact_threads.get(i)
+    if thread is None or not thread.is_alive():
+        thread = threading.Thread(target=compact_save_journal, args=(i,))
+        save_compact_threads[i] = thread
+        thread.start()
+
+
+def read_legacy_save_slots():
+    # Read all save slots from the single file used by older versions.
+    slots = [None for i in range(SAVE_NSLOTS)]
+    try:
+        with open(SAVE_SLOTS_PATH) as f:
+            loaded_slots = json.load(f)
+    except (OSError, ValueError):
+        pass
+    else:
+        for i in range(min(len(loaded_slots), len(slots))):
+            slots[i] = loaded_slots[i]
+
+    for path in [SAVE_JOURNAL_OLD_PATH, SAVE_JOURNAL_PATH]:
+        for change in read_save_journal(path):
+            i = change.get("slot")
+            if i in range(len(slots)):
+                slots[i] = apply_save_change(slots[i], change)
+
+    return slots
+
+
+def rebuild_save_index():
+    """
+    Rebuild the save index from the slot files, or split the save file
+    of older versions into slot files if there are none yet.
+    """
+    global save_index_text
+
+    have_slot_files = False
+    for i in range(SAVE_NSLOTS):
+        for ext in list(SAVE_FORMATS.values()) + [".journal", ".journal.old"]:
+            if os.path.exists(get_save_slot_path(i, ext)):
+                have_slot_files = True
+
+    if have_slot_files:
+        for i in range(SAVE_NSLOTS):
+            save_slots[i] = get_save_summary(read_save_slot(i))
+    else:
+        legacy_slots = read_legacy_save_slots()
+        for i in range(SAVE_NSLOTS):
+            slot = legacy_slots[i]
+            save_slots[i] = get_save_summary(slot)
+            if slot is not None:
+                loaded_save_slots[i] = slot
+                save_journal_cache[i] = get_save_cache(slot)
+                if not NOSAVE:
+                    write_save_slot_file(i, slot)
+
+    if not NOSAVE:
+        save_index_text = json.dumps(save_slots, indent=4)
+        write_file_atomic(SAVE_INDEX_PATH, save_index_text)
+        loaded_save_slots.clear()
+        save_journal_cache.clear()
+
+
+set_config_dir(CONFIG)
+roster_hp = RosterStats(get_tangomon_hp_max)
+roster_power = RosterStats(get_tangomon_base_power)
+tangoji_index = TangojiIndex()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Headless battle simulator for balancing Tangomon.
+
+Battles are fought with the same rules the game uses (the functions in
+:mod:`tangomon_core`), with a simulated player who answers correctly
+with a given probability after a given response time.  For each zone,
+a run has a player who has a tangomon from every earlier zone beat each
+tangomon of the zone once, in a random order, retrying lost battles.
+A run in which a tangomon is still not beaten after ``MAX_ATTEMPTS``
+battles is given up on and counted as not cleared, and clear times are
+averaged over the cleared runs only.
+
+Tests of tangojections are not simulated, since when they come up
+depends on the real time between sessions.  Tangokans are not
+simulated either: the simulated player never uses them.
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import random
+import time
+
+import tangomon_core as core
+
+
+DECK_SIZE = 20
+RESPONSE_TIME = 3.0
+ACCURACY = 0.9
+RUNS = 1000
+MAX_ROUNDS = 1000
+MAX_ATTEMPTS = 100
+
+
+def get_empty_result():
+    return {"battles": 0, "wins": 0, "battle_time": 0.0, "cleared": 0,
+            "clear_time": 0.0, "clear_time_sq": 0.0}
+
+
+def init_worker(data_dir):
+    # Find the tangomon once per process.
+    if data_dir:
+        core.DATA = data_dir
+    core.find_tangomon()
+    core.index_tangomon()
+
+
+def start_run(zone_i, deck_size):
+    # Set up the core as a new game of a player who has a tangomon from
+    # every zone before the zone at index zone_i.
+    core.new_game("Simulator")
+    for i in range(zone_i):
+        tset = core.tangomon_sets[core.ZONES[i]]
+        core.add_player_tangomon(random.choice(sorted(tset)))
+    core.give_starter_tangomon()
+
+    for i in range(deck_size):
+        word = "tangoji{}".format(i)
+        core.add_player_tangoji(word, word)
+
+
+def simulate_battle(enemy, accuracy, response_time):
+    """
+    Fight one battle against ``enemy`` and return whether the player
+    won and how long the battle took, in seconds.
+    """
+    player = random.choice(core.player_tangomon)
+    player_hp = core.get_tangomon_hp_buffed(player)
+    player_power = core.get_tangomon_power_buffed(player)
+    enemy_hp = core.get_tangomon_hp_max(enemy)
+    enemy_power = core.get_tangomon_base_power(enemy)
+
+    frames = core.BATTLE_START_WAIT
+    for i in range(MAX_ROUNDS):
+        tangoji = random.choice(core.player_tangojis)
+        response = max(0, random.gauss(response_time, response_time / 4))
+        response *= core.FPS
+        if random.random() < accuracy:
+            answer = tangoji["word"]
+        else:
+            answer = ""
+        bonus = core.grade_tangoji(tangoji, answer,
+                                   core.TANGOJI_ENTRY_TIME - response)
+
+        if bonus:
+            enemy_hp -= core.get_attack_damage(player_power, bonus)[0]
+            frames += response + core.ATTACK_INTERVAL_TIME
+        else:
+            player_hp -= core.get_counterattack_damage(enemy_power)
+            frames += response + core.ATTACK_INTERVAL_FAIL_TIME
+
+        if enemy_hp <= 0 or player_hp <= 0:
+            break
+
+    core.restore_tangoji_power()
+    frames += core.ATTACK_INTERVAL_TIME
+    return enemy_hp <= 0, frames / core.FPS
+
+
+def simulate_zone(zone_i, runs, accuracy, response_time, deck_size, seed):
+    """
+    Simulate ``runs`` runs through the zone at index ``zone_i`` and
+    return the totals as a dictionary.
+    """
+    random.seed(seed)
+    zone = core.ZONES[zone_i]
+    result = get_empty_result()
+    for run in range(runs):
+        start_run(zone_i, deck_size)
+        enemies = sorted(core.tangomon_sets[zone])
+        random.shuffle(enemies)
+        clear_time = 0.0
+        for enemy in enemies:
+            for attempt in range(MAX_ATTEMPTS):
+                won, battle_time = simulate_battle(enemy, accuracy,
+                                                   response_time)
+                result["battles"] += 1
+                result["wins"] += won
+                result["battle_time"] += battle_time
+                clear_time += battle_time
+                if won:
+                    break
+            else:
+                # The player is not going to beat this one; give up on
+                # the zone.
+                break
+        else:
+            result["cleared"] += 1
+            result["clear_time"] += clear_time
+            result["clear_time_sq"] += clear_time ** 2
+
+    return result
+
+
+def run_simulation(zones, runs, accuracies, response_times,
+                   deck_size=DECK_SIZE, jobs=None, seed=None,
+                   data_dir=None):
+    """
+    Simulate every combination of the given answer accuracies and
+    response times in each of ``zones`` (indexes into ``ZONES``), and
+    return a list of reports, one per combination and zone.
+
+    The runs are split into chunks that are spread over ``jobs``
+    processes.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+
+    chunk = max(1, runs // (jobs * 4))
+    tasks = []
+    for accuracy, response_time in itertools.product(accuracies,
+                                                     response_times):
+        for zone_i in zones:
+            key = (accuracy, response_time, zone_i)
+            for start in range(0, runs, chunk):
+                n = min(chunk, runs - start)
+                tasks.append((key, (zone_i, n, accuracy, response_time,
+                                    deck_size, hash((seed, key, start)))))
+
+    totals = {}
+    with concurrent.futures.ProcessPoolExecutor(
+            jobs, initializer=init_worker, initargs=(data_dir,)) as pool:
+        futures = {pool.submit(simulate_zone, *args): key
+                   for key, args in tasks}
+        for future in concurrent.futures.as_completed(futures):
+            key = futures[future]
+            total = totals.setdefault(key, get_empty_result())
+            for name, value in future.result().items():
+                total[name] += value
+
+    reports = []
+    for key in sorted(totals):
+        accuracy, response_time, zone_i = key
+        total = totals[key]
+        cleared = total["cleared"]
+        if cleared:
+            mean_clear = total["clear_time"] / cleared
+            var_clear = max(0, total["clear_time_sq"] / cleared
+                            - mean_clear ** 2)
+            sd_clear = var_clear ** 0.5
+        else:
+            mean_clear = None
+            sd_clear = None
+        reports.append({
+            "zone": core.ZONES[zone_i], "accuracy": accuracy,
+            "response_time": response_time, "runs": runs,
+            "battles": total["battles"],
+            "win_rate": total["wins"] / total["battles"],
+            "mean_battle_time": total["battle_time"] / total["battles"],
+            "cleared": cleared / runs,
+            "mean_clear_time": mean_clear,
+            "clear_time_sd": sd_clear})
+
+    return reports
+
+
+def print_reports(reports):
+    print("{:>8} {:>8}  {:<26} {:>9} {:>8} {:>10} {:>8} {:>12}".format(
+        "Accuracy", "Response", "Zone", "Battles", "Win rate", "Battle (s)",
+        "Cleared", "Clear (min)"))
+    for r in reports:
+        if r["mean_clear_time"] is not None:
+            clear = "{:.1f}".format(r["mean_clear_time"] / 60)
+        else:
+            clear = "-"
+        print("{:>8.0%} {:>7.1f}s  {:<26} {:>9} {:>8.1%} {:>10.1f} "
+              "{:>8.1%} {:>12}".format(
+                  r["accuracy"], r["response_time"], r["zone"], r["battles"],
+                  r["win_rate"], r["mean_battle_time"], r["cleared"], clear))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="tangomon_sim",
+        description="Simulate Tangomon battles and report win rates and "
+                    "time to clear each zone.")
+    parser.add_argument(
+        "-n", "--runs", type=int, default=RUNS,
+        help="Runs through each zone to simulate (Default: {}).".format(
+            RUNS))
+    parser.add_argument(
+        "-a", "--accuracy", type=float, nargs="+", default=[ACCURACY],
+        help="Chance of answering a tangoji correctly, from 0 to 1. "
+             "Several values can be given to compare them "
+             "(Default: {}).".format(ACCURACY))
+    parser.add_argument(
+        "-t", "--response-time", type=float, nargs="+",
+        default=[RESPONSE_TIME],
+        help="Average time taken to answer, in seconds.  Several values "
+             "can be given to compare them (Default: {}).".format(
+                 RESPONSE_TIME))
+    parser.add_argument(
+        "--deck-size", type=int, default=DECK_SIZE,
+        help="Number of tangojis the player has (Default: {}).".format(
+            DECK_SIZE))
+    parser.add_argument(
+        "-z", "--zone", action="append", choices=core.ZONES,
+        help="Zone to simulate.  Can be given more than once "
+             "(Default: all zones).")
+    parser.add_argument(
+        "-j", "--jobs", type=int,
+        help="Number of processes to use (Default: one per CPU).")
+    parser.add_argument("--seed", type=int, help="Random seed.")
+    parser.add_argument(
+        "-d", "--datadir",
+        help='Where to load the game data from (Default: "{}")'.format(
+            core.DATA))
+    parser.add_argument(
+        "--json", action="store_true",
+        help="Output the results as JSON instead of a table.")
+    args = parser.parse_args()
+
+    if args.runs < 1:
+        parser.error("argument -n/--runs: must be at least 1: {}".format(
+            args.runs))
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("argument -j/--jobs: must be at least 1: {}".format(
+            args.jobs))
+    for accuracy in args.accuracy:
+        if not 0 <= accuracy <= 1:
+            parser.error("argument -a/--accuracy: must be from 0 to 1: "
+                         "{}".format(accuracy))
+
+    if args.zone:
+        zones = [core.ZONES.index(zone) for zone in args.zone]
+    else:
+        zones = list(range(len(core.ZONES)))
+
+    start = time.perf_counter()
+    reports = run_simulation(zones, args.runs, args.accuracy,
+                             args.response_time, deck_size=args.deck_size,
+                             jobs=args.jobs, seed=args.seed,
+                             data_dir=args.datadir)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        print(json.dumps(reports, indent=4))
+    else:
+        print_reports(reports)
+        battles = sum(r["battles"] for r in reports)
+        print("\n{} battles simulated in {:.1f} s ({:.0f} per second).".format(
+            battles, elapsed, battles / elapsed))
+
+
+if __name__ == "__main__":
+    main()